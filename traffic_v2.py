@@ -10,7 +10,7 @@ Resume-highlight features added:
 
 Run:   python traffic_v2.py
 Dash:  http://localhost:5050
-Deps:  pip install ultralytics supervision flask opencv-python numpy
+Deps:  pip install ultralytics supervision flask opencv-python numpy numba
 """
 
 import cv2
@@ -18,15 +18,25 @@ import numpy as np
 import time
 import csv
 import os
+import atexit
+from array import array
+from bisect import bisect_left
 import threading
+import queue
 import webbrowser
-from math import hypot
 from datetime import datetime
-from collections import defaultdict, deque
+from collections import Counter, defaultdict, deque, OrderedDict
+from dataclasses import dataclass, field
 
+import orjson
+import msgpack
+import torch
+from numba import njit
 from ultralytics import YOLO
 import supervision as sv
-from flask import Flask, jsonify, render_template_string, session, request, redirect, url_for
+from flask import Flask, Response, jsonify, session, request, redirect, url_for
+from flask.json.provider import DefaultJSONProvider
+from flask_compress import Compress
 from dotenv import load_dotenv
 
 load_dotenv()  # loads credentials from .env file
@@ -36,10 +46,20 @@ load_dotenv()  # loads credentials from .env file
 # ──────────────────────────────────────────────
 VIDEO_PATH          = "Traffic_Video.mp4"
 MODEL_NAME          = "yolov8n.pt"
+BATCH_SIZE          = 4             # max frames per YOLO call (amortises GPU launch cost)
+BATCH_FILL_S        = 0.03          # longest wait for a batch to fill before running it short
+INT8_CALIB_DATA     = None          # dataset yaml of traffic frames → INT8 TensorRT engine (None = FP16)
+ENGINE_PRECISION    = "int8" if INT8_CALIB_DATA else "fp16"
+MODEL_ENGINE        = f"yolov8n_b{BATCH_SIZE}_{ENGINE_PRECISION}.engine"  # TensorRT export of MODEL_NAME (GPU only)
+IMG_SIZE            = 640           # fixed inference size so TensorRT can specialise
+VID_STRIDE          = 2             # run YOLO on every Nth frame, reuse last tracks in between
 CONF_THRESHOLD      = 0.40          # detection confidence
 TRACK_CLASSES       = {"car", "bus", "truck", "motorbike"}
+VEHICLE_CLASSES     = ("car", "bus", "truck", "motorbike")    # column order of lane count arrays
+CLASS_IDX           = {name: i for i, name in enumerate(VEHICLE_CLASSES)}
 INCIDENT_TIMEOUT    = 5.0           # seconds a vehicle must stay still → incident
 INCIDENT_DIST_PX    = 15            # pixels of movement tolerance
+INCIDENT_DIST_PX_SQ = INCIDENT_DIST_PX * INCIDENT_DIST_PX  # compared against dx²+dy² (no sqrt)
 LOG_FILE            = "traffic_log.csv"
 FLASK_PORT          = 5050
 PIXEL_TO_METER      = 0.05          # ← change after calibration
@@ -47,19 +67,29 @@ SPEED_LIMIT_KMPH    = 50            # vehicles above this are flagged by speed c
 SPEEDER_LOG_FILE    = "speeders_log.csv"
 EMERGENCY_CLASSES   = {"bus", "truck"}  # large vehicle proxy for ambulance/fire truck
 EMERGENCY_SPEED_KMH = 40            # fast large vehicle = likely emergency vehicle
+SSE_COALESCE_S      = 0.05          # frame updates within this window go out as one push
+PUBLISH_INTERVAL_S  = 0.1           # dashboard snapshot rate cap (~10 Hz); alerts publish at once
+DISPLAY_EVERY       = 1             # show every Nth processed frame in the OpenCV window
+HEATMAP_SCALE       = 0.5           # heatmap resolution relative to the video (upscaled for display)
+HEATMAP_REFRESH     = 5             # frames between heatmap overlay re-renders (blur + colormap)
 
 # ──────────────────────────────────────────────
-# SHARED STATE  (Flask ↔ OpenCV thread-safe)
+# SHARED STATE  (Flask ↔ OpenCV, lock-free snapshot swap)
 # ──────────────────────────────────────────────
+# The OpenCV loop builds a complete new dict every frame and rebinds this name;
+# a published snapshot is never mutated, so Flask readers just grab the current
+# reference (a single atomic load under the GIL) without taking any lock.
 shared_state = {
     "lane_counts": {},          # {lane_id: {class: count}}
     "vehicle_count": 0,
     "incidents": [],            # list of active incident dicts
+    "incidents_seq": 0,         # bumped when the set of (track_id, lane) incidents changes, not on duration ticks
     "mode": "lanes",
     "fps": 0.0,
     "frame_id": 0,
     "speed_data": {},           # {track_id: speed_kmh}
     "speeders": [],             # recent speeding events
+    "speeders_seq": 0,          # total speeding events published so far
     "emergency_active": False,
     "emergency_lane": None,
     "lane_trends":   {},   # {lane_id_str: "↑"/"↓"/"→"}
@@ -68,30 +98,126 @@ shared_state = {
     "lane_queue":    {},   # {lane_id_str: stopped count at RED}
     "wrong_way":     [],   # list of track_ids flagged this frame
     "tailgating":    [],   # list of {id_a, id_b, lane} this frame
+    "lane_ids_sorted": [], # [lane_id_str, ...] in numeric order (fixed per run)
+    "num_lanes":     0,    # len(lane_ids_sorted)
 }
-state_lock = threading.Lock()
+state_cond = threading.Condition()   # notified after every shared_state swap (SSE push)
+
+# ──────────────────────────────────────────────
+# NUMERIC KERNELS  (Numba — compiled once, cached on disk)
+# ──────────────────────────────────────────────
+# nogil: the compiled code runs without the GIL, so Flask handler threads are
+# not locked out while the OpenCV loop is inside a kernel.
+@njit(cache=True, fastmath=True, nogil=True)
+def trend_slope(ring, start, n):
+    """Least-squares slope of the n samples in ring buffer `ring` beginning at
+    `start` (oldest first), regressed against 0..n-1."""
+    w = ring.shape[0]
+    xm = (n - 1) / 2.0
+    num = 0.0
+    den = 0.0
+    for i in range(n):
+        dx = i - xm
+        num += dx * ring[(start + i) % w]
+        den += dx * dx
+    return num / den
+
+@njit(cache=True, fastmath=True, nogil=True)
+def trend_slopes(buf, head, count):
+    """trend_slope() of every row of the ring buffers ``buf`` in one call; rows
+    holding fewer than 3 samples get 0."""
+    rows, w = buf.shape
+    out = np.zeros(rows)
+    for r in range(rows):
+        n = count[r]
+        if n >= 3:
+            out[r] = trend_slope(buf[r], (head[r] - n) % w, n)
+    return out
+
+@njit(cache=True, nogil=True)
+def incident_mask(prev_xy, cur_xy, thresh_sq):
+    """True where a track moved more than sqrt(thresh_sq) px since prev_xy."""
+    n = cur_xy.shape[0]
+    out = np.empty(n, dtype=np.bool_)
+    for i in range(n):
+        dx = cur_xy[i, 0] - prev_xy[i, 0]
+        dy = cur_xy[i, 1] - prev_xy[i, 1]
+        out[i] = dx*dx + dy*dy > thresh_sq
+    return out
+
+@njit(cache=True, fastmath=True, nogil=True)
+def track_speeds(ends, m_per_px):
+    """km/h per row of ``ends`` = (x0, y0, t0, x1, y1, t1), the oldest and newest
+    history samples of a track; 0 where no time has elapsed between them."""
+    n = ends.shape[0]
+    out = np.zeros(n)
+    for i in range(n):
+        dt = ends[i, 5] - ends[i, 2]
+        if dt > 0:
+            dx = ends[i, 3] - ends[i, 0]
+            dy = ends[i, 4] - ends[i, 1]
+            out[i] = np.sqrt(dx*dx + dy*dy) * m_per_px / dt * 3.6
+    return out
+
+# ──────────────────────────────────────────────
+# BUFFERED CSV WRITER
+# ──────────────────────────────────────────────
+class BufferedCSVWriter:
+    """One long-lived CSV handle; rows are batched and flushed by count or age."""
+    FLUSH_ROWS = 64    # rows held before a forced flush
+    FLUSH_SECS = 1.0   # max age of buffered rows
+
+    def __init__(self, path: str, header: list):
+        self.path = path
+        self.f = open(path, "w", newline="", buffering=1 << 16)
+        self.w = csv.writer(self.f)
+        self.w.writerow(header)
+        self.buf = []
+        self.last_flush = time.time()
+        atexit.register(self.close)   # don't lose the tail on quit
+
+    def write(self, rows: list):
+        self.buf.extend(rows)
+        if len(self.buf) >= self.FLUSH_ROWS or time.time() - self.last_flush > self.FLUSH_SECS:
+            self.flush()
+
+    def flush(self):
+        if self.buf:
+            self.w.writerows(self.buf)
+            self.buf.clear()
+        self.f.flush()
+        self.last_flush = time.time()
+
+    def close(self):
+        if not self.f.closed:
+            self.flush()
+            self.f.close()
 
 # ──────────────────────────────────────────────
 # SPEED CAMERA LOGGER
 # ──────────────────────────────────────────────
 class SpeedCameraLogger:
     """Logs speeding vehicles once per overspeed event (not every frame)."""
+    MAX_TRACKED_IDS = 10_000   # LRU cap so long sessions don't grow without bound
+
     def __init__(self, path: str):
         self.path = path
-        self.logged_ids = {}   # track_id → last logged speed bucket
-        with open(path, "w", newline="") as f:
-            csv.writer(f).writerow(["timestamp", "frame_id", "track_id",
-                                     "lane_id", "speed_kmh", "class"])
+        self.logged_ids = OrderedDict()   # track_id → last logged speed bucket (LRU order)
+        self.out = BufferedCSVWriter(path, ["timestamp", "frame_id", "track_id",
+                                            "lane_id", "speed_kmh", "class"])
 
-    def log(self, frame_id: int, track_id: int, lane_id, speed_kmh: float, label: str):
+    def log(self, frame_id: int, track_id: int, lane_id, speed_kmh: float, label: str,
+            ts: str = None):
         bucket = int(speed_kmh // 10)  # only re-log if speed changes by 10 km/h
         if self.logged_ids.get(track_id) == bucket:
+            self.logged_ids.move_to_end(track_id)   # still active: keep it out of eviction
             return None
         self.logged_ids[track_id] = bucket
-        ts = datetime.now().isoformat(timespec="seconds")
-        with open(self.path, "a", newline="") as f:
-            csv.writer(f).writerow([ts, frame_id, track_id, lane_id,
-                                     round(speed_kmh, 1), label])
+        self.logged_ids.move_to_end(track_id)
+        if len(self.logged_ids) > self.MAX_TRACKED_IDS:
+            self.logged_ids.popitem(last=False)
+        ts = ts or datetime.now().isoformat(timespec="seconds")
+        self.out.write([[ts, frame_id, track_id, lane_id, round(speed_kmh, 1), label]])
         return {"timestamp": ts, "track_id": track_id, "lane": lane_id,
                 "speed_kmh": round(speed_kmh, 1), "class": label}
 
@@ -101,55 +227,51 @@ class SpeedCameraLogger:
 class CSVLogger:
     def __init__(self, path: str):
         self.path = path
-        self._write_header()
-
-    def _write_header(self):
-        with open(self.path, "w", newline="") as f:
-            w = csv.writer(f)
-            w.writerow(["timestamp", "frame_id", "lane_id",
-                         "cars", "buses", "trucks", "motorbikes", "total", "incident"])
+        self.out = BufferedCSVWriter(path, ["timestamp", "frame_id", "lane_id",
+                                            "cars", "buses", "trucks", "motorbikes",
+                                            "total", "incident"])
 
-    def log(self, frame_id: int, lane_counts: dict, incidents: list):
-        ts = datetime.now().isoformat(timespec="seconds")
+    def log(self, frame_id: int, lane_counts: np.ndarray, incidents: list, ts: str = None):
+        """lane_counts is the (lanes × VEHICLE_CLASSES) array; row i holds lane i+1."""
+        ts = ts or datetime.now().isoformat(timespec="seconds")
         incident_lanes = {inc["lane"] for inc in incidents}
-        with open(self.path, "a", newline="") as f:
-            w = csv.writer(f)
-            for lane_id, counts in lane_counts.items():
-                w.writerow([
-                    ts, frame_id, lane_id,
-                    counts.get("car", 0),
-                    counts.get("bus", 0),
-                    counts.get("truck", 0),
-                    counts.get("motorbike", 0),
-                    sum(counts.values()),
-                    int(lane_id in incident_lanes),
-                ])
+        self.out.write([
+            [ts, frame_id, lane_id, *c, sum(c), int(lane_id in incident_lanes)]
+            for lane_id, c in enumerate(lane_counts.tolist(), 1)
+        ])
 
 # ──────────────────────────────────────────────
 # INCIDENT DETECTOR
 # ──────────────────────────────────────────────
 class IncidentDetector:
-    """Flags vehicles that haven't moved for INCIDENT_TIMEOUT seconds."""
-    def __init__(self):
-        self.history = {}   # track_id → {"pos": (x,y), "still_since": float}
-
-    def update(self, track_id: int, cx: int, cy: int, lane_id: int) -> bool:
-        now = time.time()
-        if track_id not in self.history:
-            self.history[track_id] = {"pos": (cx, cy), "still_since": now, "lane": lane_id}
-            return False
-        prev = self.history[track_id]
-        dist = hypot(cx - prev["pos"][0], cy - prev["pos"][1])
-        if dist > INCIDENT_DIST_PX:
-            # vehicle moved — reset timer
-            self.history[track_id] = {"pos": (cx, cy), "still_since": now, "lane": lane_id}
-            return False
-        else:
-            still_for = now - prev["still_since"]
-            return still_for >= INCIDENT_TIMEOUT
-
-    def cleanup(self, active_ids: set):
-        self.history = {k: v for k, v in self.history.items() if k in active_ids}
+    """Flags vehicles that haven't moved for INCIDENT_TIMEOUT seconds.
+
+    State is kept in arrays indexed by TrackHistory slot, so a whole frame is
+    checked with one vectorised call.
+    """
+    def __init__(self, n_slots: int):
+        self.pos         = np.zeros((n_slots, 2), dtype=np.int64)   # where the still spell began
+        self.still_since = np.zeros(n_slots, dtype=np.float64)
+        self.known       = np.zeros(n_slots, dtype=bool)
+
+    def update_batch(self, slots: np.ndarray, cxs: np.ndarray, cys: np.ndarray, now: float) -> np.ndarray:
+        """Feed one frame of tracks; returns the incident mask."""
+        cur   = np.column_stack((cxs, cys)).astype(np.int64)
+        moved = ~self.known[slots] | incident_mask(self.pos[slots], cur, INCIDENT_DIST_PX_SQ)
+        # new or moved vehicles — reset their timer
+        reset = slots[moved]
+        self.pos[reset]         = cur[moved]
+        self.still_since[reset] = now
+        self.known[reset]       = True
+        return ~moved & (now - self.still_since[slots] >= INCIDENT_TIMEOUT)
+
+    def forget(self, slots: np.ndarray):
+        self.known[slots] = False
+
+    def cleanup(self, active_slots: np.ndarray):
+        keep = self.known[active_slots]
+        self.known[:] = False
+        self.known[active_slots] = keep
 
 # ──────────────────────────────────────────────
 # LANE TREND TRACKER  (rule-based predictive optimisation)
@@ -164,23 +286,32 @@ class LaneTrendTracker:
     WINDOW = 20      # samples  (~10 s at typical processing speeds)
     THRESHOLD = 0.15 # slope magnitude to call a trend definite
 
-    def __init__(self):
-        self.history: dict = defaultdict(lambda: deque(maxlen=self.WINDOW))
+    def __init__(self, n_lanes: int):
+        # Preallocated ring buffer per lane (row = lane_id-1): no per-sample allocation
+        self.buf   = np.zeros((n_lanes, self.WINDOW), dtype=np.float64)
+        self.head  = np.zeros(n_lanes, dtype=np.int32)   # next write slot
+        self.count = np.zeros(n_lanes, dtype=np.int32)   # samples held (≤ WINDOW)
 
     def update(self, lane_id: int, count: int):
-        self.history[lane_id].append(count)
+        r = lane_id - 1
+        h = self.head[r]
+        self.buf[r, h] = count
+        self.head[r] = (h + 1) % self.WINDOW
+        if self.count[r] < self.WINDOW:
+            self.count[r] += 1
 
     def trend(self, lane_id: int) -> float:
         """Linear regression slope over the rolling window."""
-        h = list(self.history[lane_id])
-        n = len(h)
+        r = lane_id - 1
+        n = int(self.count[r])
         if n < 3:
             return 0.0
-        xs = list(range(n))
-        mx, my = sum(xs) / n, sum(h) / n
-        num = sum((x - mx) * (y - my) for x, y in zip(xs, h))
-        den = sum((x - mx) ** 2 for x in xs) or 1e-9
-        return num / den
+        # oldest sample sits n slots behind the write head
+        return trend_slope(self.buf[r], (int(self.head[r]) - n) % self.WINDOW, n)
+
+    def trends(self) -> np.ndarray:
+        """trend() of every lane in one kernel call, indexed by lane_id-1."""
+        return trend_slopes(self.buf, self.head, self.count)
 
     def label(self, lane_id: int) -> str:
         """Unicode arrow — for the HTML dashboard."""
@@ -204,75 +335,167 @@ class FlowRateTracker:
     WINDOW = 60.0   # seconds
 
     def __init__(self):
-        # lane_id → deque of (track_id, timestamp)
-        self.log: dict = defaultdict(lambda: deque())
+        # lane_id → parallel arrays: entry timestamps (ascending) and track IDs
+        self.ts:  dict = defaultdict(lambda: array("d"))
+        self.ids: dict = defaultdict(lambda: array("q"))
+        # lane_id → {track_id: entries still in the window}; len() is the unique count
+        self.active: dict = defaultdict(Counter)
+
+    def record_batch(self, lane_ids: np.ndarray, track_ids: np.ndarray, now: float):
+        """Record every (lane, track) entry of one frame, one extend per lane."""
+        for lane_id in np.unique(lane_ids).tolist():
+            tids = track_ids[lane_ids == lane_id].tolist()
+            self.ts[lane_id].extend([now] * len(tids))
+            self.ids[lane_id].extend(tids)
+            self.active[lane_id].update(tids)
+
+    def rate(self, lane_id: int, now: float) -> float:
+        """Vehicles per minute for this lane over the last 60 s."""
+        ts, ids = self.ts[lane_id], self.ids[lane_id]
+        # drop old entries — binary-search the cutoff, then one slice delete
+        k = bisect_left(ts, now - self.WINDOW)
+        if k:
+            active = self.active[lane_id]
+            for tid in ids[:k]:
+                active[tid] -= 1
+                if not active[tid]:
+                    del active[tid]
+            del ts[:k]
+            del ids[:k]
+        return round(len(self.active[lane_id]) / (self.WINDOW / 60), 1)   # per-minute rate
 
-    def record(self, lane_id: int, track_id: int):
-        now = time.time()
-        self.log[lane_id].append((track_id, now))
+# ──────────────────────────────────────────────
+# TRACK HISTORY  (per-track centroid ring buffers for speed estimation)
+# ──────────────────────────────────────────────
+class TrackHistory:
+    """Last HIST_LEN (cx, cy, t) samples per track, held in parallel NumPy slabs.
 
-    def rate(self, lane_id: int) -> float:
-        """Vehicles per minute for this lane over the last 60 s."""
-        now = time.time()
-        cutoff = now - self.WINDOW
-        buf = self.log[lane_id]
-        # drop old entries
-        while buf and buf[0][1] < cutoff:
-            buf.popleft()
-        unique_ids = len({tid for tid, _ in buf})
-        return round(unique_ids / (self.WINDOW / 60), 1)   # per-minute rate
+    Live IDs are looked up in a sorted (id, row) index with one searchsorted.
+    New IDs take the rows seen least recently (never-used rows first), so
+    tracks on screen together never share a row; MAX_TRACKS bounds how many
+    tracks one frame can hold.
+    """
+    HIST_LEN   = 8
+    MAX_TRACKS = 1024
+
+    def __init__(self):
+        self.pos   = np.zeros((self.MAX_TRACKS, self.HIST_LEN, 2), dtype=np.int16)
+        self.t     = np.zeros((self.MAX_TRACKS, self.HIST_LEN), dtype=np.float64)
+        self.head  = np.zeros(self.MAX_TRACKS, dtype=np.intp)   # next write index
+        self.count = np.zeros(self.MAX_TRACKS, dtype=np.intp)   # samples held (≤ HIST_LEN)
+        self.owner = np.full(self.MAX_TRACKS, -1, dtype=np.int64)   # track ID holding each row
+        self.last_seen  = np.full(self.MAX_TRACKS, -1, dtype=np.int64)   # slots() call that last used the row
+        self.calls      = 0
+        self.ids_sorted  = np.empty(0, dtype=np.int64)   # owner IDs, ascending
+        self.rows_sorted = np.empty(0, dtype=np.intp)    # their rows, same order
+
+    def slots(self, track_ids):
+        """Slab row for each track ID, plus the rows newly claimed (and reset)
+        for IDs not seen before — callers keeping per-row state reset those too."""
+        ids = np.asarray(track_ids, dtype=np.int64)
+        self.calls += 1
+        out = np.empty(len(ids), dtype=np.intp)
+        hit = np.zeros(len(ids), dtype=bool)
+        if len(self.ids_sorted):
+            pos = np.minimum(np.searchsorted(self.ids_sorted, ids), len(self.ids_sorted) - 1)
+            hit = self.ids_sorted[pos] == ids
+            out[hit] = self.rows_sorted[pos[hit]]
+            self.last_seen[out[hit]] = self.calls
+        new   = ~hit
+        n_new = int(new.sum())
+        fresh = np.empty(0, dtype=np.intp)
+        if n_new:   # least recently seen rows; argpartition skips a full sort
+            fresh = np.argpartition(self.last_seen, n_new - 1)[:n_new]
+            out[new] = fresh
+            self.owner[fresh]     = ids[new]
+            self.last_seen[fresh] = self.calls
+            self.head[fresh]  = 0
+            self.count[fresh] = 0
+            live  = np.flatnonzero(self.owner >= 0)
+            order = np.argsort(self.owner[live], kind="stable")
+            self.ids_sorted, self.rows_sorted = self.owner[live][order], live[order]
+        return out, fresh
+
+    def push(self, slots: np.ndarray, cxs: np.ndarray, cys: np.ndarray, now: float):
+        h = self.head[slots]
+        self.pos[slots, h, 0] = cxs
+        self.pos[slots, h, 1] = cys
+        self.t[slots, h]      = now
+        self.head[slots]  = (h + 1) % self.HIST_LEN
+        self.count[slots] = np.minimum(self.count[slots] + 1, self.HIST_LEN)
+
+    def ends(self, slots: np.ndarray) -> np.ndarray:
+        """(x0, y0, t0, x1, y1, t1) rows: oldest and newest sample per slot.
+
+        Slots with fewer than two samples get an all-zero row (dt = 0)."""
+        out = np.zeros((len(slots), 6), dtype=np.float64)
+        c   = self.count[slots]
+        ok  = c >= 2
+        s   = slots[ok]
+        h   = self.head[s]
+        old = (h - c[ok]) % self.HIST_LEN
+        new = (h - 1) % self.HIST_LEN
+        out[ok, 0:2] = self.pos[s, old]
+        out[ok, 2]   = self.t[s, old]
+        out[ok, 3:5] = self.pos[s, new]
+        out[ok, 5]   = self.t[s, new]
+        return out
 
 # ──────────────────────────────────────────────
 # LOS GRADE  (Highway Capacity Manual simplified)
 # ──────────────────────────────────────────────
+_LOS_TABLE = (
+    ("A", "#4ade80",  "Free flow"),
+    ("B", "#a3e635",  "Reasonable free flow"),
+    ("C", "#facc15",  "Stable flow"),
+    ("D", "#fb923c",  "Approaching unstable"),
+    ("E", "#f87171",  "Unstable flow"),
+    ("F", "#dc2626",  "Forced / breakdown"),
+)
+_LOS_BOUNDS = np.array([3, 6, 10, 15, 22])   # inclusive upper count of grades A..E
+# Every count up to the last bound maps straight to its grade; anything above is F
+_LOS_BY_COUNT = tuple(_LOS_TABLE[i] for i in
+                      np.searchsorted(_LOS_BOUNDS, np.arange(_LOS_BOUNDS[-1] + 1)))
+
 def los_grade(vehicle_count: int) -> tuple:
     """Return (grade, colour_hex, description) for a lane vehicle count."""
-    if vehicle_count <= 3:  return ("A", "#4ade80",  "Free flow")
-    if vehicle_count <= 6:  return ("B", "#a3e635",  "Reasonable free flow")
-    if vehicle_count <= 10: return ("C", "#facc15",  "Stable flow")
-    if vehicle_count <= 15: return ("D", "#fb923c",  "Approaching unstable")
-    if vehicle_count <= 22: return ("E", "#f87171",  "Unstable flow")
-    return                         ("F", "#dc2626",  "Forced / breakdown")
+    n = int(vehicle_count)
+    return _LOS_BY_COUNT[n] if n < len(_LOS_BY_COUNT) else _LOS_TABLE[-1]
+
+def los_grades(counts: np.ndarray) -> list:
+    """los_grade() for a whole array of lane counts in one searchsorted."""
+    return [_LOS_TABLE[i] for i in np.searchsorted(_LOS_BOUNDS, counts)]
+
+# ──────────────────────────────────────────────
+# STATUS BANDS  (lane density / vehicle speed → colour and label tables)
+# ──────────────────────────────────────────────
+# Band index = how many bounds the value has reached, so a table lookup
+# replaces the chained ternaries in the drawing code
+DENSITY_BOUNDS     = np.array([5, 15])                          # vehicles per lane
+DENSITY_COLORS     = ((0,255,0), (0,255,255), (0,0,255))        # lanes mode (BGR)
+DENSITY_RED_COLORS = ((0,160,255), (0,0,220), (0,0,180))        # timer mode, lanes on red
+DENSITY_STATUS     = ("CLEAR", "MODERATE", "CONGESTED")
+SPEED_BOUNDS       = np.array([40, 80])                         # km/h
+SPEED_COLORS       = ((0,255,0), (0,165,255), (0,0,255))
+
+def bands(bounds: np.ndarray, values) -> list:
+    """Band index of every value in one searchsorted."""
+    return np.searchsorted(bounds, values, side="right").tolist()
 
 # ──────────────────────────────────────────────
 # SESSION STATS  (for summary on quit)
 # ──────────────────────────────────────────────
-_ss_all_ids:       set  = set()
-_ss_peak_count:    int  = 0
-_ss_peak_time:     str  = ""
-_ss_total_inc:     int  = 0
-_ss_wrong_ids:     set  = set()
-_ss_tailgate:      int  = 0
-_ss_start:         str  = datetime.now().isoformat(timespec="seconds")
-
-# Convenience namespace so callers use session_stats["key"] syntax
-class _SessionStats:
-    @property
-    def all_ids(self):         return _ss_all_ids
-    @property
-    def peak_count(self):      return _ss_peak_count
-    @peak_count.setter
-    def peak_count(self, v):   global _ss_peak_count; _ss_peak_count = v
-    @property
-    def peak_time(self):       return _ss_peak_time
-    @peak_time.setter
-    def peak_time(self, v):    global _ss_peak_time; _ss_peak_time = v
-    @property
-    def total_incidents(self): return _ss_total_inc
-    @total_incidents.setter
-    def total_incidents(self, v): global _ss_total_inc; _ss_total_inc = v
-    @property
-    def wrong_way_ids(self):   return _ss_wrong_ids
-    @property
-    def tailgate_events(self): return _ss_tailgate
-    @tailgate_events.setter
-    def tailgate_events(self, v): global _ss_tailgate; _ss_tailgate = v
-    @property
-    def session_start(self):   return _ss_start
-    def __getitem__(self, k):  return getattr(self, k)
-    def __setitem__(self, k, v): setattr(self, k, v)
-
-session_stats = _SessionStats()
+@dataclass
+class SessionStats:
+    all_ids:         set = field(default_factory=set)
+    peak_count:      int = 0
+    peak_time:       str = ""
+    total_incidents: int = 0
+    wrong_way_ids:   set = field(default_factory=set)
+    tailgate_events: int = 0
+    session_start:   str = field(default_factory=lambda: datetime.now().isoformat(timespec="seconds"))
+
+session_stats = SessionStats()
 
 
 DASHBOARD_HTML = """
@@ -351,6 +574,10 @@ DASHBOARD_HTML = """
     .kpi-val.red{color:var(--red)}
     .kpi-val.yellow{color:var(--yellow)}
     .kpi-val.cyan{color:var(--cyan)}
+    .kpi-val.flash-up{animation:flash-up .5s ease-out}
+    .kpi-val.flash-down{animation:flash-down .5s ease-out}
+    @keyframes flash-up{from,60%{color:var(--red)}}
+    @keyframes flash-down{from,60%{color:var(--green)}}
     .kpi-sub{font-size:.7rem;color:var(--muted);margin-top:5px}
     .kpi-bar{position:absolute;bottom:0;left:0;height:3px;border-radius:0 0 18px 18px;
       background:linear-gradient(90deg,#a855f7,#7c3aed);width:60%;transition:width .6s}
@@ -559,20 +786,43 @@ DASHBOARD_HTML = """
     </div>
   </div>
 
-  <div class="footer">Traffic Intelligence Dashboard &mdash; <a href="/api/stats">JSON API</a> &middot; <a href="/api/history">History API</a></div>
+  <div class="footer">Traffic Intelligence Dashboard &mdash; <a href="/api/stats?fmt=json">JSON API</a> &middot; <a href="/api/history?fmt=json">History API</a></div>
 </div>
 
 <script>
 // ── CONSTANTS ──
 const COLORS=['#a855f7','#22c55e','#f59e0b','#ef4444','#7c3aed','#c084fc','#f97316','#ec4899'];
+const COLOR_FILL_BAR=COLORS.map(c=>c+'66');
+const COLOR_FILL_LINE=COLORS.map(c=>c+'22');
 const LOS_C={A:'badge-green',B:'badge-green',C:'badge-yellow',D:'badge-orange',E:'badge-red',F:'badge-red'};
 const LOS_COL={A:'#4ade80',B:'#a3e635',C:'#fbbf24',D:'#fb923c',E:'#f87171',F:'#dc2626'};
+const LOS_HTML=Object.fromEntries(Object.entries(LOS_C).map(([g,c])=>[g,`<span class="los-badge ${c}">${g}</span>`]));
+const STATUS_HTML=[
+  '<span class="status-pill pill-clear">CLEAR</span>',
+  '<span class="status-pill pill-moderate">MODERATE</span>',
+  '<span class="status-pill pill-congested">CONGESTED</span>',
+];
+const TREND_HTML={'\u2191':'<span class="trend-up">\u2191</span>','\u2193':'<span class="trend-down">\u2193</span>'};
+const TREND_FLAT='<span class="trend-flat">\u2192</span>';
+const LANE_COLS=['name','car','bus','truck','motorbike','total','los','flow','q','status','trend'];
+
+// ── DOM CACHE (the script runs after the markup, so every id already exists) ──
+const $={};
+for(const id of ['lane-chart','btn-bar','btn-line','btn-pause','live-badge','live-dot','live-txt','k-veh','k-lanes','k-inc','k-mode','k-fps','k-frame-sub','k-speeders','k-speed-limit','em-banner','em-txt','inc-section','inc-list','lane-tbody','filter-hint','speed-section','speed-tbody'])
+  $[id.replace(/-(\w)/g,(_,c)=>c.toUpperCase())]=document.getElementById(id);
 
 // ── STATE ──
 let paused=false, selectedLane=null, chartType='bar', lastData={};
+const liveState={};   // merged from /api/stream deltas
+const HIST_MAX=40;    // matches history_buf maxlen on the server
+let lastHist={seq:[],t:[],lanes:{}};   // columnar; replaced (never mutated) on every change
+let chartLids=null;                     // lane set the chart datasets were built for
+let incidentsSeq=-1, speedersSeq=-1;   // last list versions rendered
+const incSubs=new Map();                // track_id → incident card detail line
+const laneRows=new Map();           // lane id -> {tr, tds, v} for the lane table
 
 // ── CHART INIT ──
-const ctx=document.getElementById('lane-chart');
+const ctx=$.laneChart;
 let chart=new Chart(ctx,{
   type:'bar',
   data:{labels:[],datasets:[]},
@@ -588,12 +838,13 @@ let chart=new Chart(ctx,{
 
 function setChartType(t){
   chartType=t;
-  document.getElementById('btn-bar').className='chart-btn'+(t==='bar'?' active':'');
-  document.getElementById('btn-line').className='chart-btn'+(t==='line'?' active':'');
+  $.btnBar.className='chart-btn'+(t==='bar'?' active':'');
+  $.btnLine.className='chart-btn'+(t==='line'?' active':'');
   // Mutate type in-place — Chart.js v4 supports this without destroy/recreate
   chart.config.type = t;
-  chart.data.datasets.forEach(ds=>{
-    ds.backgroundColor = ds.borderColor+(t==='bar'?'66':'22');
+  const fills=t==='bar'?COLOR_FILL_BAR:COLOR_FILL_LINE;
+  chart.data.datasets.forEach((ds,i)=>{
+    ds.backgroundColor = fills[i%COLORS.length];
     ds.borderWidth     = t==='bar'?0:2;
     ds.borderRadius    = t==='bar'?6:0;
     ds.tension         = 0.4;
@@ -606,10 +857,10 @@ function setChartType(t){
 
 function togglePause(){
   paused=!paused;
-  const btn=document.getElementById('btn-pause');
-  const badge=document.getElementById('live-badge');
-  const dot=document.getElementById('live-dot');
-  const txt=document.getElementById('live-txt');
+  const btn=$.btnPause;
+  const badge=$.liveBadge;
+  const dot=$.liveDot;
+  const txt=$.liveTxt;
   btn.innerHTML=paused?'&#x25B6;&#xFE0F; Resume':'&#x23F8;&#xFE0F; Pause';
   btn.className='btn'+(paused?' active':'');
   if(paused){
@@ -625,166 +876,241 @@ function togglePause(){
     txt.style.color='#86efac';
     txt.textContent='LIVE';
     badge.classList.remove('badge-paused','badge-offline');
+    if(Object.keys(liveState).length){
+      lastData={s:{...liveState},hist:lastHist};
+      renderData(lastData.s,lastData.hist);
+    }
   }
 }
 
-function exportData(){
-  const blob=new Blob([JSON.stringify(lastData,null,2)],{type:'application/json'});
+// Export: pretty-printing runs in an inline worker so the live view never stalls
+const exportWorker=new Worker(URL.createObjectURL(new Blob([
+  "onmessage=e=>postMessage(new Blob([JSON.stringify(e.data,(k,v)=>ArrayBuffer.isView(v)?Array.from(v):v,2)],"+
+  "{type:'application/json'}));"
+],{type:'text/javascript'})));
+exportWorker.onmessage=e=>{
   const a=document.createElement('a');
-  a.href=URL.createObjectURL(blob);
+  a.href=URL.createObjectURL(e.data);
   a.download='traffic_snapshot_'+new Date().toISOString().slice(0,19).replace(/:/g,'-')+'.json';
   a.click();
+  setTimeout(()=>URL.revokeObjectURL(a.href),1000);
+};
+function exportData(){
+  exportWorker.postMessage(lastData);
 }
 
 function losClass(l){return LOS_C[l]||'badge-green';}
-function statusPill(t){
-  if(t<5)return '<span class="status-pill pill-clear">CLEAR</span>';
-  if(t<15)return '<span class="status-pill pill-moderate">MODERATE</span>';
-  return '<span class="status-pill pill-congested">CONGESTED</span>';
-}
-function trendEl(a){
-  if(a==='\u2191')return '<span class="trend-up">\u2191</span>';
-  if(a==='\u2193')return '<span class="trend-down">\u2193</span>';
-  return '<span class="trend-flat">\u2192</span>';
-}
+function losBadge(l){return LOS_HTML[l]||`<span class="los-badge ${losClass(l)}">${l}</span>`;}
+function statusPill(t){return STATUS_HTML[t<5?0:t<15?1:2];}
+function trendEl(a){return TREND_HTML[a]||TREND_FLAT;}
 
+// Value flashes are CSS animations; swapping flash-up/flash-down restarts them
+// and the class is dropped on animationend, so no timers are involved
 function animateVal(el,newVal){
   const cur=parseFloat(el.textContent)||0;
   if(cur===newVal||el.textContent==='—')return el.textContent=newVal;
-  el.style.transition='color .3s';
-  el.style.color=newVal>cur?'var(--red)':'var(--green)';
+  const up=newVal>cur;
+  el.classList.remove(up?'flash-down':'flash-up');
+  el.classList.add(up?'flash-up':'flash-down');
   el.textContent=newVal;
-  setTimeout(()=>el.style.color='',500);
+}
+document.addEventListener('animationend',e=>{
+  if(e.animationName.startsWith('flash-'))e.target.classList.remove('flash-up','flash-down');
+});
+
+// Append a columnar history delta, keeping the newest HIST_MAX points
+function mergeHist(h,tail){
+  const keep=Math.max(0,h.seq.length+tail.seq.length-HIST_MAX);
+  const cat=(a,b)=>[...a,...b].slice(keep);   // spread: columns may be typed arrays
+  const lanes={};
+  for(const lid of new Set([...Object.keys(h.lanes),...Object.keys(tail.lanes)])){
+    lanes[lid]=cat(h.lanes[lid]||new Array(h.seq.length).fill(0),
+                   tail.lanes[lid]||new Array(tail.seq.length).fill(0));
+  }
+  return {seq:cat(h.seq,tail.seq),t:cat(h.t,tail.t),lanes};
 }
 
-function updateChart(hist){
-  if(!hist.length)return;
-  const labels=hist.map(h=>h.t);
-  let lids=[...new Set(hist.flatMap(h=>Object.keys(h.lanes||{})))].sort();
+function updateChart(hist,laneIds){
+  if(!hist.seq.length)return;
+  let lids=laneIds||Object.keys(hist.lanes).sort();
   if (selectedLane) {
     lids = lids.filter(l => String(l) === String(selectedLane));
   }
-  const newDatasets=lids.map((lid,i)=>({
-    label:'Lane '+lid,
-    data:hist.map(h=>(h.lanes||{})[lid]??0),
-    backgroundColor:COLORS[i%COLORS.length]+(chartType==='bar'?'66':'22'),
-    borderColor:COLORS[i%COLORS.length],
-    borderWidth:chartType==='bar'?0:2,
-    borderRadius:chartType==='bar'?6:0,
-    tension:0.4,fill:chartType==='line',
-    pointRadius:chartType==='line'?2:0,
-    pointHoverRadius:5,
-  }));
-  chart.data.labels=labels;
-  chart.data.datasets=newDatasets;
+  const key=lids.join(',');
+  if(key===chartLids&&chart.data.labels===hist.t)return;   // nothing new since the last draw
+  chart.data.labels=hist.t;
+  if(key===chartLids){
+    // Same lanes: the columns are fresh arrays, so just repoint each dataset
+    chart.data.datasets.forEach((ds,i)=>ds.data=hist.lanes[lids[i]]);
+    chart.update('none');
+    return;
+  }
+  // Lane set changed: styling only depends on the slot index, so existing
+  // dataset objects are relabelled in place and only missing slots are created
+  const dss=chart.data.datasets;
+  dss.length=Math.min(dss.length,lids.length);
+  lids.forEach((lid,i)=>{
+    if(i<dss.length){dss[i].label='Lane '+lid; dss[i].data=hist.lanes[lid]; return;}
+    const bar=chartType==='bar';
+    dss.push({
+      label:'Lane '+lid,
+      data:hist.lanes[lid],
+      backgroundColor:(bar?COLOR_FILL_BAR:COLOR_FILL_LINE)[i%COLORS.length],
+      borderColor:COLORS[i%COLORS.length],
+      borderWidth:bar?0:2,
+      borderRadius:bar?6:0,
+      tension:0.4,fill:!bar,
+      pointRadius:bar?0:2,
+      pointHoverRadius:5,
+    });
+  });
+  chartLids=key;
   chart.update('none');
 }
 
+function addLaneRow(parent,lid){
+  const tr=document.createElement('tr');
+  tr.id='lane-row-'+lid;
+  tr.onclick=()=>selectLane(lid);
+  const tds={};
+  for(const c of LANE_COLS)tds[c]=tr.insertCell();
+  tds.name.innerHTML=`<b style="font-size:.9rem">Lane ${lid}</b>`;
+  tds.flow.style.fontVariantNumeric='tabular-nums';
+  parent.appendChild(tr);
+  const row={tr,tds,v:{}};
+  laneRows.set(lid,row);
+  return row;
+}
+
+// Write a cell only when its value changed; html (if given) replaces textContent
+function setCell(row,col,val,html){
+  if(row.v[col]===val)return;
+  row.v[col]=val;
+  if(html===undefined)row.tds[col].textContent=val;
+  else row.tds[col].innerHTML=html;
+}
+
+// Renders are deferred to the next animation frame; pushes that land before it
+// fires just replace the pending arguments, so a burst costs one paint.
+let pendingRender=null;
 function renderData(s, hist) {
+  if(!pendingRender)requestAnimationFrame(()=>{
+    const p=pendingRender; pendingRender=null;
+    drawData(p.s,p.hist);
+  });
+  pendingRender={s,hist};
+}
+
+function drawData(s, hist) {
   // KPIs
-  animateVal(document.getElementById('k-veh'),s.vehicle_count??'—');
-  document.getElementById('k-lanes').textContent=Object.keys(s.lane_counts||{}).length;
-  const incEl=document.getElementById('k-inc');
+  animateVal($.kVeh,s.vehicle_count??'—');
+  $.kLanes.textContent=s.num_lanes??'—';
+  const incEl=$.kInc;
   incEl.textContent=(s.incidents||[]).length;
   incEl.className='kpi-val '+(s.incidents?.length?'red':'green');
-  document.getElementById('k-mode').textContent=(s.mode||'').toUpperCase()||'—';
-  document.getElementById('k-fps').textContent=s.fps??'—';
-  document.getElementById('k-frame-sub').textContent='frame '+(s.frame_id??'—');
-  document.getElementById('k-speeders').textContent=(s.speeders||[]).length;
-  if(s.speed_limit)document.getElementById('k-speed-limit').textContent='limit: '+s.speed_limit+' km/h';
+  $.kMode.textContent=(s.mode||'').toUpperCase()||'—';
+  $.kFps.textContent=s.fps??'—';
+  $.kFrameSub.textContent='frame '+(s.frame_id??'—');
+  $.kSpeeders.textContent=(s.speeders||[]).length;
+  if(s.speed_limit)$.kSpeedLimit.textContent='limit: '+s.speed_limit+' km/h';
 
   // Emergency
-  const emb=document.getElementById('em-banner');
+  const emb=$.emBanner;
   if(s.emergency_active){
     emb.style.display='block';
-    document.getElementById('em-txt').textContent='Lane '+s.emergency_lane+' given priority — timer extended';
+    $.emTxt.textContent='Lane '+s.emergency_lane+' given priority — timer extended';
   } else emb.style.display='none';
 
-  // Incidents
-  const is=document.getElementById('inc-section');
-  if(s.incidents?.length){
-    is.style.display='block';
-    document.getElementById('inc-list').innerHTML=s.incidents.map(inc=>`
-      <div class="alert-card" style="background:#1a0808;border-color:#ef444450;color:#fca5a5;margin-bottom:8px">
-        <span class="alert-icon">&#x1F6A8;</span>
-        <div>
-          <div class="alert-title">Incident &mdash; Lane ${inc.lane}</div>
-          <div class="alert-sub">Vehicle #${inc.track_id} stopped ${inc.duration}s at (${inc.cx}, ${inc.cy})</div>
-        </div>
-      </div>`).join('');
-  } else is.style.display='none';
-
-  // Lane table
-  const tb=document.getElementById('lane-tbody');
-  tb.innerHTML='';
+  // Incidents. incidents_seq only tracks which (track_id, lane) pairs are
+  // active, so it gates rebuilding the card list; duration and position
+  // change on every publish and are refreshed in place below.
+  if(s.incidents_seq!==incidentsSeq){
+    incidentsSeq=s.incidents_seq;
+    const is=$.incSection;
+    if(s.incidents?.length){
+      is.style.display='block';
+      $.incList.innerHTML=s.incidents.map(inc=>`
+        <div class="alert-card" style="background:#1a0808;border-color:#ef444450;color:#fca5a5;margin-bottom:8px">
+          <span class="alert-icon">&#x1F6A8;</span>
+          <div>
+            <div class="alert-title">Incident &mdash; Lane ${inc.lane}</div>
+            <div class="alert-sub" data-track="${inc.track_id}"></div>
+          </div>
+        </div>`).join('');
+    } else is.style.display='none';
+    incSubs.clear();
+    for(const el of $.incList.querySelectorAll('[data-track]'))incSubs.set(el.dataset.track,el);
+  }
+  for(const inc of s.incidents||[]){
+    const el=incSubs.get(String(inc.track_id));
+    if(el)el.textContent=`Vehicle #${inc.track_id} stopped ${inc.duration}s at (${inc.cx}, ${inc.cy})`;
+  }
+
+  // Lane table — one cached row per lane, only changed cells are touched
+  const newRows=document.createDocumentFragment();   // new lanes are filled off-DOM, inserted once
+  const seen=new Set();
   for(const[lid,counts] of Object.entries(s.lane_counts||{})){
+    seen.add(lid);
+    const row=laneRows.get(lid)||addLaneRow(newRows,lid);
     const total=Object.values(counts).reduce((a,b)=>a+b,0);
     const los=(s.lane_los||{})[lid]||'?';
     const flow=(s.lane_flow||{})[lid]??'—';
     const q=(s.lane_queue||{})[lid]??0;
     const arrow=(s.lane_trends||{})[lid]||'\u2192';
-    const isSelected=String(selectedLane)===String(lid);
-    const lc=LOS_COL[los]||'#64748b';
-    const flowDisp=typeof flow==='number'?flow.toFixed(1):flow;
-    tb.innerHTML+=`
-      <tr onclick="selectLane('${lid}')" ${isSelected?'class="lane-selected"':''} id="lane-row-${lid}">
-        <td><b style="font-size:.9rem">Lane ${lid}</b></td>
-        <td>${counts.car||0}</td><td>${counts.bus||0}</td>
-        <td>${counts.truck||0}</td><td>${counts.motorbike||0}</td>
-        <td><b>${total}</b></td>
-        <td><span class="los-badge ${losClass(los)}">${los}</span></td>
-        <td style="font-variant-numeric:tabular-nums">${flowDisp}</td>
-        <td>${q>0?`<span class="queue-val">${q}</span>`:q}</td>
-        <td>${statusPill(total)}</td>
-        <td>${trendEl(arrow)}</td>
-      </tr>`;
+    const pill=statusPill(total);
+    setCell(row,'car',counts.car||0);
+    setCell(row,'bus',counts.bus||0);
+    setCell(row,'truck',counts.truck||0);
+    setCell(row,'motorbike',counts.motorbike||0);
+    setCell(row,'total',total,`<b>${total}</b>`);
+    setCell(row,'los',los,losBadge(los));
+    setCell(row,'flow',typeof flow==='number'?flow.toFixed(1):flow);
+    setCell(row,'q',q,q>0?`<span class="queue-val">${q}</span>`:undefined);
+    setCell(row,'status',pill,pill);
+    setCell(row,'trend',arrow,trendEl(arrow));
+    row.tr.classList.toggle('lane-selected',String(selectedLane)===String(lid));
+  }
+  if(newRows.firstChild)$.laneTbody.appendChild(newRows);
+  for(const[lid,row] of laneRows){
+    if(!seen.has(lid)){row.tr.remove(); laneRows.delete(lid);}
+  }
+  if(selectedLane)$.filterHint.textContent='Lane '+selectedLane+' selected — click again to deselect';
+  else $.filterHint.textContent='';
+
+  // Speed (rebuilt only when new speeding events arrived)
+  if(s.speeders_seq!==speedersSeq){
+    speedersSeq=s.speeders_seq;
+    const ss=$.speedSection;
+    if(s.speeders?.length){
+      ss.style.display='block';
+      $.speedTbody.innerHTML=[...s.speeders].reverse().slice(0,12).map(sp=>`
+        <tr>
+          <td style="color:var(--muted);font-size:.76rem">${sp.timestamp}</td>
+          <td><b>#${sp.track_id}</b></td>
+          <td>Lane ${sp.lane||'—'}</td>
+          <td><span style="color:var(--red);font-weight:700">${sp.speed_kmh} km/h</span></td>
+          <td style="color:var(--muted)">${sp.class||'—'}</td>
+        </tr>`).join('');
+    } else ss.style.display='none';
   }
-  if(selectedLane)document.getElementById('filter-hint').textContent='Lane '+selectedLane+' selected — click again to deselect';
-  else document.getElementById('filter-hint').textContent='';
-
-  // Speed
-  const ss=document.getElementById('speed-section');
-  if(s.speeders?.length){
-    ss.style.display='block';
-    document.getElementById('speed-tbody').innerHTML=[...s.speeders].reverse().slice(0,12).map(sp=>`
-      <tr>
-        <td style="color:var(--muted);font-size:.76rem">${sp.timestamp}</td>
-        <td><b>#${sp.track_id}</b></td>
-        <td>Lane ${sp.lane||'—'}</td>
-        <td><span style="color:var(--red);font-weight:700">${sp.speed_kmh} km/h</span></td>
-        <td style="color:var(--muted)">${sp.class||'—'}</td>
-      </tr>`).join('');
-  } else ss.style.display='none';
 
   // Chart
-  updateChart(hist);
+  updateChart(hist,s.lane_ids_sorted);
 }
 
-async function poll(){
-  if(paused)return;
-  try{
-    const[sr,hr]=await Promise.all([fetch('/api/stats'),fetch('/api/history')]);
-    if(!sr.ok || !hr.ok) throw new Error('Network response was not ok');
-    lastData = {s: await sr.json(), hist: await hr.json()};
-    
+function setOnline(on){
+  const badge=$.liveBadge;
+  const dot=$.liveDot;
+  const txt=$.liveTxt;
+  if(on){
     // Restore LIVE status if we were offline
-    const badge=document.getElementById('live-badge');
-    const dot=document.getElementById('live-dot');
-    const txt=document.getElementById('live-txt');
-    if(badge.classList.contains('badge-offline')){
-      badge.classList.remove('badge-offline');
-      dot.style.animation='pulse-dot 1.4s ease-in-out infinite';
-      dot.style.background='#22c55e';
-      txt.style.color='#86efac';
-      txt.textContent='LIVE';
-    }
-    
-    renderData(lastData.s, lastData.hist);
-  }catch(e){
-    console.warn('poll err',e);
-    const badge=document.getElementById('live-badge');
-    const dot=document.getElementById('live-dot');
-    const txt=document.getElementById('live-txt');
+    if(!badge.classList.contains('badge-offline'))return;
+    badge.classList.remove('badge-offline');
+    dot.style.animation='pulse-dot 1.4s ease-in-out infinite';
+    dot.style.background='#22c55e';
+    txt.style.color='#86efac';
+    txt.textContent='LIVE';
+  } else {
     badge.classList.add('badge-offline');
     dot.style.animation='none';
     dot.style.background='#ef4444';
@@ -793,23 +1119,155 @@ async function poll(){
   }
 }
 
+// /api/history.bin → columnar history; lane columns stay Uint16Array views on the buffer
+function decodeHistBin(buf){
+  const [n,nl]=new Uint32Array(buf,0,2);
+  const seq=new Uint32Array(buf,8,n), tod=new Uint32Array(buf,8+4*n,n);
+  const ids=new Uint16Array(buf,8+8*n,nl);
+  const p2=x=>String(x).padStart(2,'0');
+  const t=Array.from(tod,x=>p2(x/3600|0)+':'+p2((x/60|0)%60)+':'+p2(x%60));
+  const lanes={};
+  let off=8+8*n+2*nl;
+  for(const id of ids){lanes[id]=new Uint16Array(buf,off,n); off+=2*n;}
+  return {seq:Array.from(seq),t,lanes};
+}
+
+// Stats and history arrive as pushed deltas; EventSource reconnects on its own after errors
+let es=null, histCtl=null;   // histCtl: in-flight cold-start history fetch
+function openStream(since){
+  // A stream opened without the cold-start cursor sends the full history
+  // itself, so a slower history.bin response would only overwrite newer data
+  if(histCtl){histCtl.abort(); histCtl=null;}
+  if(es)es.close();
+  es=new EventSource('/api/stream'+(since!=null?'?since='+since:''));
+  es.onopen=()=>setOnline(true);
+  es.onerror=()=>setOnline(false);
+  es.onmessage=e=>{
+    const d=JSON.parse(e.data);
+    if(d.hist){lastHist=d.hist; delete d.hist;}
+    if(d.hist_tail){lastHist=mergeHist(lastHist,d.hist_tail); delete d.hist_tail;}
+    Object.assign(liveState,d);
+    if(paused)return;
+    lastData={s:{...liveState},hist:lastHist};
+    renderData(lastData.s,lastData.hist);
+  };
+}
+
+// Cold start: load the history buffer in binary, then stream only what follows it
+(async()=>{
+  let since=null;
+  const ctl=histCtl=new AbortController();
+  try{
+    const r=await fetch('/api/history.bin',{signal:ctl.signal});
+    if(!r.ok) throw new Error('Network response was not ok');
+    lastHist=decodeHistBin(await r.arrayBuffer());
+    if(lastHist.seq.length)since=lastHist.seq[lastHist.seq.length-1];
+  }catch(e){
+    if(e.name==='AbortError')return;   // superseded by a stream that was opened meanwhile
+    console.warn('history err',e);
+  }
+  histCtl=null;
+  if(!document.hidden)openStream(since);   // otherwise visibilitychange opens it
+})();
+
+// Hidden tabs drop their stream; on return it resumes from the newest history point held
+document.addEventListener('visibilitychange',()=>{
+  if(document.hidden){
+    if(es){es.close(); es=null;}
+  } else if(!es){
+    const n=lastHist.seq.length;
+    openStream(n?lastHist.seq[n-1]:null);
+  }
+});
+
 function selectLane(lid){
   if(String(selectedLane)===String(lid)){selectedLane=null;}
   else{selectedLane=lid;}
   if(lastData.s) renderData(lastData.s, lastData.hist);
 }
-
-poll(); setInterval(poll,2000);
 </script>
 </body></html>
 """
 
+class ORJSONProvider(DefaultJSONProvider):
+    """Route jsonify / app.json through orjson (C encoder, NumPy-aware)."""
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 app.secret_key = "traffic-intel-secret-2024"
+app.config.update(
+    COMPRESS_MIMETYPES=["text/html", "application/json", "application/msgpack",
+                        "application/octet-stream"],
+    COMPRESS_ALGORITHM=["br", "gzip"],
+    COMPRESS_STREAMS=False,   # SSE pushes must reach the browser as soon as they are yielded
+)
+Compress(app)
 
 DASH_USER = os.environ.get("DASH_USER", "admin")
 DASH_PASS = os.environ.get("DASH_PASS", "changeme")
 
+def history_columns(points):
+    """History rows → columnar ``{seq: [...], t: [...], lanes: {lane_id: [...]}}``."""
+    return {
+        "seq":   [h["seq"] for h in points],
+        "t":     [h["t"] for h in points],
+        "lanes": {lid: [h["lanes"].get(lid, 0) for h in points]
+                  for lid in (points[-1]["lanes"] if points else ())},   # lane set is fixed
+    }
+
+def _msgpack_default(obj):
+    if isinstance(obj, (np.ndarray, np.generic)):
+        return obj.tolist()
+    raise TypeError(f"cannot serialize {type(obj).__name__}")
+
+def _encode(obj, fmt):
+    """(body, mimetype) for ``fmt`` "json" or "msgpack"; both handle NumPy values."""
+    if fmt == "json":
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY), "application/json"
+    return msgpack.packb(obj, use_bin_type=True, default=_msgpack_default), "application/msgpack"
+
+def _request_fmt():
+    return "json" if request.args.get("fmt") == "json" else "msgpack"
+
+def packed_response(obj):
+    """MessagePack response; ``?fmt=json`` falls back to JSON for debugging."""
+    body, mimetype = _encode(obj, _request_fmt())
+    return app.response_class(body, mimetype=mimetype)
+
+# Encoded shared_state per format, tagged with the snapshot it came from. A
+# snapshot is immutable, so every request that lands on the same frame reuses
+# the bytes; a racing refill just recomputes the same body.
+_state_bodies: dict = {}   # fmt → (snapshot, body, mimetype)
+
+def state_response(snap):
+    fmt = _request_fmt()
+    cached = _state_bodies.get(fmt)
+    if cached is None or cached[0] is not snap:
+        cached = _state_bodies[fmt] = (snap, *_encode(snap, fmt))
+    return app.response_class(cached[1], mimetype=cached[2])
+
+# Process start stamp, so ETags handed out by a previous run never match
+_ETAG_EPOCH = format(int(time.time()), "x")
+
+def revalidated(tag, build):
+    """ETag-guarded response: 304 without calling ``build`` when the client
+    already holds ``tag``. Flask-Compress appends ":<algorithm>" to strong
+    ETags of compressed bodies, so those forms match as well."""
+    tag = f"{_ETAG_EPOCH}-{tag}"
+    inm = request.if_none_match
+    if inm.contains(tag) or any(inm.contains(f"{tag}:{a}") for a in app.config["COMPRESS_ALGORITHM"]):
+        resp = app.response_class(status=304)
+    else:
+        resp = build()
+    resp.set_etag(tag)
+    resp.headers["Cache-Control"] = "no-cache"   # always revalidate, never serve stale
+    return resp
+
 
 LANDING_HTML = """<!DOCTYPE html>
 <html lang="en">
@@ -944,7 +1402,7 @@ LANDING_HTML = """<!DOCTYPE html>
   <div class="stat-item"><div class="stat-num">YOLOv8</div><div class="stat-label">Detection Model</div></div>
   <div class="stat-item"><div class="stat-num">ByteTrack</div><div class="stat-label">Object Tracking</div></div>
   <div class="stat-item"><div class="stat-num">4</div><div class="stat-label">Vehicle Classes</div></div>
-  <div class="stat-item"><div class="stat-num">2s</div><div class="stat-label">Update Interval</div></div>
+  <div class="stat-item"><div class="stat-num">Live</div><div class="stat-label">SSE Push Updates</div></div>
 </div>
 <div class="section" id="features">
   <div class="section-tag">&#x2728; Features</div>
@@ -965,7 +1423,7 @@ LANDING_HTML = """<!DOCTYPE html>
 <div class="section">
   <div class="section-tag">&#x1F4DD; Dashboard Metrics</div>
   <div class="section-title">What the dashboard shows you</div>
-  <p class="section-sub">All key metrics in real-time, updating every 2 seconds.</p>
+  <p class="section-sub">All key metrics in real-time, streamed live as the video is analysed.</p>
   <div class="metrics-preview">
     <div class="metric-card"><div class="metric-card-icon">&#x1F697;</div><div class="metric-card-val">Live</div><div class="metric-card-label">Total Vehicles</div></div>
     <div class="metric-card"><div class="metric-card-icon">&#x1F4CD;</div><div class="metric-card-val">A&ndash;F</div><div class="metric-card-label">Level of Service</div></div>
@@ -1002,10 +1460,14 @@ if(new URLSearchParams(window.location.search).get('error')==='1'){openLogin();d
 </script>
 </body></html>"""
 
+# Compiled once at import; render_template_string would re-lex and compile per request
+LANDING_TEMPLATE   = app.jinja_env.from_string(LANDING_HTML)
+DASHBOARD_TEMPLATE = app.jinja_env.from_string(DASHBOARD_HTML)
+
 
 @app.route("/")
 def home():
-    return render_template_string(LANDING_HTML)
+    return LANDING_TEMPLATE.render()
 
 @app.route("/login", methods=["POST"])
 def login():
@@ -1025,28 +1487,109 @@ def logout():
 def dashboard():
     if not session.get("authenticated"):
         return redirect(url_for("home") + "?error=1")
-    with state_lock:
-        s = dict(shared_state)
-    return render_template_string(DASHBOARD_HTML, stats=s)
+    return DASHBOARD_TEMPLATE.render(stats=shared_state)
 
 @app.route("/api/stats")
 def api_stats():
     if not session.get("authenticated"):
         return jsonify({"error": "Unauthorized"}), 401
-    with state_lock:
-        return jsonify(shared_state)
+    snap = shared_state
+    return revalidated(f"s{snap['frame_id']}-{_request_fmt()}", lambda: state_response(snap))
+
+@app.route("/api/stream")
+def api_stream():
+    """Server-Sent Events: pushes only the keys that changed since the last push.
+
+    History rides along: the first push carries the whole buffer as ``hist``,
+    later pushes carry only the points appended since as ``hist_tail`` (both in
+    the columnar shape of ``history_columns``). Each
+    push is tagged with the newest history seq as its event id, so a client
+    reconnecting with ``Last-Event-ID`` (or opening with ``?since=<seq>``) only
+    receives the points it is missing.
+    """
+    if not session.get("authenticated"):
+        return jsonify({"error": "Unauthorized"}), 401
+    resume_seq = request.headers.get("Last-Event-ID", type=int)
+    if resume_seq is None:
+        resume_seq = request.args.get("since", type=int)   # history already loaded via history.bin
+
+    def gen():
+        last_sent = {}
+        last_seq = resume_seq            # newest history seq this client has
+        while True:
+            with state_cond:
+                fresh = state_cond.wait_for(lambda: shared_state is not last_sent, timeout=15)
+            if not fresh:
+                yield b": keepalive\n\n"
+                continue
+            time.sleep(SSE_COALESCE_S)   # let a burst of frames settle into one push
+            snap = shared_state
+            delta = {k: v for k, v in snap.items()
+                     if k not in last_sent or (last_sent[k] is not v and last_sent[k] != v)}
+            last_sent = snap             # snapshots are never mutated, safe to keep
+            hist = list(history_buf)     # one atomic copy; the frame loop keeps appending
+            if hist and hist[-1]["seq"] != last_seq:
+                if last_seq is None or not hist[0]["seq"] - 1 <= last_seq < hist[-1]["seq"]:
+                    delta["hist"] = history_columns(hist)   # first push, missed points evicted, or restart
+                else:
+                    delta["hist_tail"] = history_columns([h for h in hist if h["seq"] > last_seq])
+                last_seq = hist[-1]["seq"]
+            if delta:
+                head = b"id: %d\n" % last_seq if last_seq is not None else b""
+                yield head + b"data: " + orjson.dumps(delta, option=orjson.OPT_SERIALIZE_NUMPY) + b"\n\n"
+
+    return Response(gen(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route("/api/history")
 def api_history():
+    """History points newer than ``?since=<seq>`` (the whole buffer if omitted)."""
     if not session.get("authenticated"):
         return jsonify({"error": "Unauthorized"}), 401
-    return jsonify(list(history_buf))
+    since = request.args.get("since", 0, type=int)
+    hist = list(history_buf)
+    latest = hist[-1]["seq"] if hist else 0
+    return revalidated(f"h{latest}-{since}-{_request_fmt()}", lambda: packed_response({
+        "hist":       history_columns([h for h in hist if h["seq"] > since]),
+        "latest_seq": latest,
+    }))
+
+@app.route("/api/history.bin")
+def api_history_bin():
+    """History as packed little-endian typed arrays (decoded by decodeHistBin).
+
+    Layout: uint32 n, n_lanes | uint32 seq[n] | uint32 t[n] (seconds since
+    midnight) | uint16 lane_id[n_lanes] | uint16 counts[n_lanes][n], one
+    contiguous run per lane. ``?since=<seq>`` works as on /api/history.
+    """
+    if not session.get("authenticated"):
+        return jsonify({"error": "Unauthorized"}), 401
+    since = request.args.get("since", 0, type=int)
+    hist = list(history_buf)
+    latest = hist[-1]["seq"] if hist else 0
+    return revalidated(f"b{latest}-{since}",
+                       lambda: pack_history([h for h in hist if h["seq"] > since]))
+
+def pack_history(hist):
+    lids = list(hist[-1]["lanes"]) if hist else []
+    tod  = [int(hh) * 3600 + int(mm) * 60 + int(ss)
+            for hh, mm, ss in (h["t"].split(":") for h in hist)]
+    body = b"".join((
+        np.array([len(hist), len(lids)], dtype="<u4").tobytes(),
+        np.array([h["seq"] for h in hist], dtype="<u4").tobytes(),
+        np.array(tod, dtype="<u4").tobytes(),
+        np.array([int(l) for l in lids], dtype="<u2").tobytes(),
+        np.array([[h["lanes"].get(l, 0) for h in hist] for l in lids], dtype="<u2").tobytes(),
+    ))
+    return app.response_class(body, mimetype="application/octet-stream")
 
 def run_flask():
     import logging
     log = logging.getLogger("werkzeug")
     log.setLevel(logging.ERROR)  # silence Flask request logs
-    app.run(host="0.0.0.0", port=FLASK_PORT, debug=False, use_reloader=False)
+    # Thread per request: each SSE client holds its connection open, so a fixed
+    # worker pool would starve once a few dashboards are connected.
+    app.run(host="0.0.0.0", port=FLASK_PORT, debug=False, use_reloader=False, threaded=True)
 
 # ──────────────────────────────────────────────
 # ROI SELECTOR
@@ -1064,7 +1607,9 @@ def draw_rectangle(event, x, y, flags, param):
         lanes.append((min(ix,x), min(iy,y), max(ix,x), max(iy,y)))
         print(f"Lane {len(lanes)} set: {lanes[-1]}")
 
-cap = cv2.VideoCapture(VIDEO_PATH)
+# Prefer hardware decoding when the backend offers it (falls back to software)
+cap = cv2.VideoCapture(VIDEO_PATH, cv2.CAP_ANY,
+                       [cv2.CAP_PROP_HW_ACCELERATION, cv2.VIDEO_ACCELERATION_ANY])
 ret, frame = cap.read()
 if not ret:
     print("Error: Could not read video. Make sure Traffic_Video.mp4 exists.")
@@ -1092,30 +1637,123 @@ cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
 # ──────────────────────────────────────────────
 # INIT TRACKING + TOOLS
 # ──────────────────────────────────────────────
-model = YOLO(MODEL_NAME)
+USE_GPU = torch.cuda.is_available()
+
+def load_model():
+    """TensorRT engine on GPU (exported once, then reused), PyTorch weights otherwise.
+
+    The engine is FP16, or INT8 calibrated on INT8_CALIB_DATA when that is set.
+    """
+    if not USE_GPU:
+        return YOLO(MODEL_NAME)
+    if not os.path.exists(MODEL_ENGINE):
+        print(f"Exporting {MODEL_NAME} to TensorRT {ENGINE_PRECISION.upper()} "
+              f"(one-time, this can take a few minutes)...")
+        precision = dict(int8=True, data=INT8_CALIB_DATA) if INT8_CALIB_DATA else dict(half=True)
+        try:
+            # dynamic batch up to BATCH_SIZE so partial batches run on the same engine
+            os.replace(YOLO(MODEL_NAME).export(format="engine", imgsz=IMG_SIZE, dynamic=True,
+                                               batch=BATCH_SIZE, device=0, **precision),
+                       MODEL_ENGINE)
+        except Exception as e:
+            print(f"TensorRT export failed ({e}); falling back to PyTorch FP16.")
+            return YOLO(MODEL_NAME)
+    return YOLO(MODEL_ENGINE, task="detect")
+
+model = load_model()
+infer_kwargs = dict(conf=CONF_THRESHOLD, imgsz=IMG_SIZE, verbose=False,
+                    half=USE_GPU, device=0 if USE_GPU else "cpu")
+
+# Class-id lookup tables so per-detection filtering is array indexing, not set probes
+n_model_classes = max(model.names) + 1
+TRACK_MASK      = np.zeros(n_model_classes, dtype=bool)        # keep this detection?
+EMERGENCY_MASK  = np.zeros(n_model_classes, dtype=bool)        # large-vehicle proxy
+CLASS_COL       = np.full(n_model_classes, -1, dtype=np.intp)  # → lane_counts column
+for cid, name in model.names.items():
+    TRACK_MASK[cid]     = name in TRACK_CLASSES
+    EMERGENCY_MASK[cid] = name in EMERGENCY_CLASSES
+    CLASS_COL[cid]      = CLASS_IDX.get(name, -1)
+TRACK_MASK_DEV  = torch.from_numpy(TRACK_MASK).to(infer_kwargs["device"])   # same LUT, where results live
 tracker = sv.ByteTrack()
 
-incident_detector = IncidentDetector()
-trend_tracker    = LaneTrendTracker()   # predictive optimisation
+incident_detector = IncidentDetector(TrackHistory.MAX_TRACKS)
+trend_tracker    = LaneTrendTracker(len(lanes))   # predictive optimisation
 logger = CSVLogger(LOG_FILE)
 speeder_logger = SpeedCameraLogger(SPEEDER_LOG_FILE)
 
 # Speed tracking (ByteTrack gives persistent IDs)
-speed_history = defaultdict(lambda: deque(maxlen=8))  # track_id → [(cx,cy,t), ...]
-heatmap = np.zeros((int(cap.get(4)), int(cap.get(3))), dtype=np.float32)
+track_history = TrackHistory()
+heatmap = np.zeros((round(frame.shape[0] * HEATMAP_SCALE), round(frame.shape[1] * HEATMAP_SCALE)),
+                   dtype=np.float32)   # reduced-resolution density grid
 flow_tracker  = FlowRateTracker()
 lane_y_med: dict = {}          # lane_id → running median y to find dominant direction
 wrong_way_counter: dict = {}   # track_id → consecutive frames flagged as wrong-way
 vehicle_last_lane: dict = {}   # track_id → last known lane_id (fallback for speed cam)
-history_buf: deque = deque(maxlen=40)   # ring buffer of (t, {lane_id: veh_count})
+history_buf: deque = deque(maxlen=40)   # ring buffer of {seq, t, lanes: {lane_id: veh_count}}
+history_seq = 0                          # seq of the newest history_buf entry (monotonic)
+all_lane_ids = list(range(1, len(lanes) + 1))
+# The lane set is fixed for the run: publish it once (the per-frame snapshot
+# carries these objects over unchanged, so the stream never resends them)
+shared_state = {**shared_state,
+                "lane_ids_sorted": [str(k) for k in all_lane_ids],
+                "num_lanes":       len(all_lane_ids)}
 
 
 mode = "lanes"
+heat_overlay, heat_overlay_frame = None, 0   # cached colour-mapped heatmap for "heatmap" mode
 signal_index, signal_timer, signal_start = 0, -1, time.time()  # -1 = uninitialised
 last_priority_adjust_time = 0.0   # cooldown tracker for time-nudging
-lane_last_green = {}               # {lane_index: timestamp when it last got green}
+lane_last_green = np.full(len(lanes), -np.inf)   # [lane_index] → when it last got green (-inf = never)
 frame_id = 0
-fps_timer = time.time()
+# Per-frame lane tallies, allocated once and zeroed in place every frame
+lane_counts      = np.zeros((len(lanes), len(VEHICLE_CLASSES)), dtype=np.int32)   # row = lane_id-1
+lane_totals      = np.zeros(len(lanes), dtype=np.int32)
+last_lane_counts = np.full_like(lane_counts, -1)   # counts behind the published lane_counts / lane_los
+trends_dirty     = True    # trend tracker fed since the last publish
+published_incidents = set()   # (track_id, lane) of the incidents last published
+last_publish     = 0.0     # frame time of the last shared_state publish
+fps_timer, fps_frames, fps = time.monotonic(), 0, 0.0   # processing-rate window
+tracked = sv.Detections.empty()    # last ByteTrack output, advanced by optical flow on stride-skipped frames
+prev_gray = None                   # previous frame in grayscale, the optical-flow reference
+
+# ──────────────────────────────────────────────
+# FRAME PRODUCER  (capture thread → ring of preallocated canvases)
+# ──────────────────────────────────────────────
+# Each slot is a full display canvas; the decoder writes straight into the area
+# below the HUD bar, so frames are never allocated or vstacked per iteration.
+# Slot indices circulate: free_slots → capture thread → ready_slots → main loop.
+HUD_H        = 46
+BATCH_FRAMES = BATCH_SIZE * VID_STRIDE   # frames spanned by one full inference batch
+N_SLOTS      = 2 * BATCH_FRAMES          # one batch decoding ahead while another is processed
+canvases     = np.empty((N_SLOTS, frame.shape[0] + HUD_H, frame.shape[1], 3), dtype=np.uint8)
+capture_ts   = np.zeros(N_SLOTS)   # wall-clock time each slot was captured
+free_slots   = queue.Queue()
+ready_slots  = queue.Queue()
+for _slot in range(N_SLOTS):
+    free_slots.put(_slot)
+
+def capture_frames():
+    try:
+        while True:
+            slot = free_slots.get()
+            if slot is None:             # shutdown sentinel
+                return
+            ok = cap.grab()
+            if not ok:
+                # End of video — loop back to the start
+                cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                ok = cap.grab()
+            if ok:
+                ok, _ = cap.retrieve(canvases[slot, HUD_H:])   # decodes in place
+            if not ok:                   # truly unreadable, give up
+                return
+            capture_ts[slot] = time.time()
+            ready_slots.put(slot)
+    finally:
+        ready_slots.put(None)            # never leave the main loop blocked on a dead producer
+
+capture_thread = threading.Thread(target=capture_frames, daemon=True)
+capture_thread.start()
 
 # ──────────────────────────────────────────────
 # START FLASK IN BACKGROUND
@@ -1127,389 +1765,527 @@ print(f"📊 Live dashboard → http://localhost:{FLASK_PORT}")
 threading.Timer(1.5, lambda: webbrowser.open(f"http://localhost:{FLASK_PORT}")).start()
 
 # ──────────────────────────────────────────────
-# HELPER: lane for a centroid
+# HELPERS: lane for a centroid, heatmap splat, snapshot reuse, optical flow
 # ──────────────────────────────────────────────
-def get_lane(cx, cy):
-    for i, (lx1,ly1,lx2,ly2) in enumerate(lanes, 1):
-        if lx1 <= cx <= lx2 and ly1 <= cy <= ly2:
-            return i
-    return None
+LANE_RECTS = np.asarray(lanes, dtype=np.int32).reshape(-1, 4)   # (L, 4): x1, y1, x2, y2
+
+def assign_lanes(cxs, cys):
+    """1-based lane id of every centroid at once (first matching lane wins, 0 = none)."""
+    if not len(LANE_RECTS):
+        return np.zeros(len(cxs), dtype=np.intp)
+    inside = ((cxs[:, None] >= LANE_RECTS[:, 0]) & (cxs[:, None] <= LANE_RECTS[:, 2]) &
+              (cys[:, None] >= LANE_RECTS[:, 1]) & (cys[:, None] <= LANE_RECTS[:, 3]))
+    return np.where(inside.any(axis=1), inside.argmax(axis=1) + 1, 0)
+
+# Pixel offsets of a filled disk, added once per fresh detection
+HEAT_R = max(1, round(12 * HEATMAP_SCALE))   # 12 video pixels
+_dy, _dx = np.nonzero(np.hypot(*np.ogrid[-HEAT_R:HEAT_R+1, -HEAT_R:HEAT_R+1]) <= HEAT_R)
+HEAT_DY, HEAT_DX = _dy - HEAT_R, _dx - HEAT_R
+
+def splat_heatmap(cxs, cys):
+    """Accumulate a radius-HEAT_R disk into the heatmap at every (video-space)
+    centroid at once."""
+    ys = ((cys * HEATMAP_SCALE).astype(np.intp)[:, None] + HEAT_DY).ravel()
+    xs = ((cxs * HEATMAP_SCALE).astype(np.intp)[:, None] + HEAT_DX).ravel()
+    ok = (ys >= 0) & (ys < heatmap.shape[0]) & (xs >= 0) & (xs < heatmap.shape[1])
+    np.add.at(heatmap, (ys[ok], xs[ok]), 1)
+
+def carry(prev, new):
+    """``prev`` when it equals ``new``, so an unchanged value keeps its identity."""
+    return prev if prev == new else new
+
+def flow_detections(dets, prev_gray, gray):
+    """Shift every box by the pyramidal-LK optical flow of its centre between two
+    frames; boxes whose centre can't be followed keep their position."""
+    xyxy = dets.xyxy.astype(np.float32)
+    pts  = ((xyxy[:, :2] + xyxy[:, 2:]) / 2).reshape(-1, 1, 2)
+    nxt, status, _ = cv2.calcOpticalFlowPyrLK(prev_gray, gray, pts, None,
+                                              winSize=(21, 21), maxLevel=2)
+    shift = np.where(status.astype(bool), (nxt - pts).reshape(-1, 2), 0)
+    return sv.Detections(xyxy=xyxy + np.tile(shift, 2),
+                         confidence=dets.confidence, class_id=dets.class_id)
 
 # ──────────────────────────────────────────────
 # MAIN LOOP
 # ──────────────────────────────────────────────
-while True:
-    ret, frame = cap.read()
-    if not ret:
-        # End of video — loop back to the start
-        cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-        ret, frame = cap.read()
-        if not ret:
-            break  # truly unreadable, give up
-    frame_id += 1
-
-    # ── FPS ──
-    now = time.time()
-    fps = 1.0 / max(now - fps_timer, 1e-9)
-    fps_timer = now
-
-    # ── YOLO DETECT ──
-    results = model(frame, conf=CONF_THRESHOLD, verbose=False)[0]
-
-    # Filter to vehicle classes only
-    vehicle_mask = np.array([
-        model.names[int(c)] in TRACK_CLASSES
-        for c in results.boxes.cls
-    ], dtype=bool)
-
-    if vehicle_mask.any():
-        filtered = results.boxes[vehicle_mask]
-        sv_dets = sv.Detections(
-            xyxy=filtered.xyxy.cpu().numpy(),
-            confidence=filtered.conf.cpu().numpy(),
-            class_id=filtered.cls.cpu().numpy().astype(int),
-        )
-    else:
-        sv_dets = sv.Detections.empty()
-
-    # ── BYTETRACK ──
-    tracked = tracker.update_with_detections(sv_dets)
-
-    # ── PER-FRAME ACCUMULATORS ──
-    lane_counts = {i+1: {"car":0,"bus":0,"truck":0,"motorbike":0} for i in range(len(lanes))}
-    active_ids  = set()
-    active_incidents      = []
-    frame_speeders        = []
-    frame_wrong_way: set  = set()
-    frame_tailgating: list = []
-    queue_counts: dict    = {}     # lane_id → stopped-vehicle count
-    emergency_lane_this_frame = None
-
-    for i in range(len(tracked)):
-        x1, y1, x2, y2 = map(int, tracked.xyxy[i])
-        track_id = int(tracked.tracker_id[i])
-        cls_id   = int(tracked.class_id[i])
-        label    = model.names[cls_id]
-        cx, cy   = (x1+x2)//2, (y1+y2)//2
-        active_ids.add(track_id)
-        lane_id = get_lane(cx, cy)
-        if lane_id:
-            vehicle_last_lane[track_id] = lane_id   # remember last confirmed lane
-        else:
-            lane_id = vehicle_last_lane.get(track_id)  # fall back to last known
-
-        # Lane count
-        if lane_id and label in lane_counts[lane_id]:
-            lane_counts[lane_id][label] += 1
-
-        # Speed (pixels/sec → km/h via PIXEL_TO_METER)
-        speed_history[track_id].append((cx, cy, time.time()))
-        speed_kmh = 0.0
-        if len(speed_history[track_id]) >= 2:
-            p1 = speed_history[track_id][0]
-            p2 = speed_history[track_id][-1]
-            dt = p2[2] - p1[2]
-            if dt > 0:
-                dist_px = hypot(p2[0]-p1[0], p2[1]-p1[1])
-                speed_kmh = (dist_px * PIXEL_TO_METER / dt) * 3.6
-
-        # ── SPEED CAMERA ──
-        if speed_kmh > SPEED_LIMIT_KMPH:
-            event = speeder_logger.log(frame_id, track_id, lane_id, speed_kmh, label)
-            if event:
-                frame_speeders.append(event)
-            # Police-style red alert box
-            cv2.rectangle(frame, (x1,y1), (x2,y2), (0,0,220), 3)
-            cv2.rectangle(frame, (x1, y1-28), (x1+220, y1), (0,0,220), -1)
-            cv2.putText(frame, f"SPEEDING  {int(speed_kmh)} km/h", (x1+4, y1-8),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.58, (255,255,255), 2)
-
-        # ── EMERGENCY VEHICLE DETECTION ──
-        if label in EMERGENCY_CLASSES and speed_kmh > EMERGENCY_SPEED_KMH and lane_id:
-            emergency_lane_this_frame = lane_id
-
-        # Incident detection
-        is_incident = lane_id and incident_detector.update(track_id, cx, cy, lane_id)
-        if is_incident:
-            still_since = incident_detector.history[track_id]["still_since"]
-            duration = round(time.time() - still_since, 1)
-            active_incidents.append({
-                "track_id": track_id, "lane": lane_id,
-                "cx": cx, "cy": cy, "duration": duration
-            })
-            # Red highlight
-            cv2.rectangle(frame, (x1,y1), (x2,y2), (0,0,255), 3)
-            cv2.putText(frame, f"INCIDENT! {duration}s", (x1, y1-10),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0,0,255), 2)
-        elif speed_kmh <= SPEED_LIMIT_KMPH:  # don't overwrite speeding box
-            # Normal annotation with speed
-            color = (0,255,0)
-            cv2.rectangle(frame, (x1,y1), (x2,y2), color, 2)
-            speed_txt = f"{int(speed_kmh)}km/h" if speed_kmh > 2 else label
-            cv2.putText(frame, f"ID{track_id} {speed_txt}", (x1, y1-8),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.52, color, 2)
-
-        # ── FLOW RATE recording ──
-        if lane_id:
-            flow_tracker.record(lane_id, track_id)
-
-
-
-        # Heatmap update
-        cv2.circle(heatmap, (cx, cy), 12, 1, -1)
-
-        # Lane label on vehicle
-        if lane_id:
-            cv2.putText(frame, f"L{lane_id}", (cx, cy),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255,255,255), 1)
-
-    incident_detector.cleanup(active_ids)
-    total_vehicles = sum(sum(c.values()) for c in lane_counts.values())
-
-    # ── SESSION STATS + LOS + FLOW (computed once per frame, after vehicle loop) ──
-    session_stats["all_ids"].update(active_ids)
-    if total_vehicles > session_stats["peak_count"]:
-        session_stats["peak_count"] = total_vehicles
-        session_stats["peak_time"]  = datetime.now().strftime("%H:%M:%S")
-    if frame_id % 90 == 0:   # history snapshot every ~3 s
-        history_buf.append({
-            "t": datetime.now().strftime("%H:%M:%S"),
-            "lanes": {str(k): sum(v.values()) for k, v in lane_counts.items()}
-        })
-    lane_los_out  = {str(k): los_grade(sum(v.values()))[0] for k, v in lane_counts.items()}
-    lane_flow_out = {str(k): flow_tracker.rate(k)          for k  in lane_counts}
-
-    # ── TREND TRACKER: feed this frame's counts ──
-    for lane_id, counts in lane_counts.items():
-        trend_tracker.update(lane_id, sum(counts.values()))
-
-    # ── MODES ──
-    if mode == "lanes":
-        for i, (lx1,ly1,lx2,ly2) in enumerate(lanes, 1):
-            total = sum(lane_counts[i].values())
-            color = (0,255,0) if total < 5 else (0,255,255) if total < 15 else (0,0,255)
-            cv2.rectangle(frame, (lx1,ly1), (lx2,ly2), color, 2)
-            cv2.putText(frame, f"Lane {i} ({total})", (lx1+5, ly1+22),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.65, color, 2)
-        y = 60
-        for i, c in lane_counts.items():
-            t = sum(c.values())
-            status = "CLEAR" if t < 5 else "MODERATE" if t < 15 else "CONGESTED"
-            cv2.putText(frame, f"Lane {i}: {c['car']}C {c['bus']}B {c['truck']}T {c['motorbike']}M | {status}",
-                        (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255,255,255), 1)
-            y += 22
-
-    elif mode == "heatmap":
-        blur = cv2.GaussianBlur(heatmap, (0,0), 25)
-        norm = cv2.normalize(blur, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
-        colored = cv2.applyColorMap(norm, cv2.COLORMAP_JET)
-        frame = cv2.addWeighted(frame, 0.55, colored, 0.45, 0)
-
-    elif mode == "speed":
+running = True
+while running:
+    # ── GATHER A BATCH: block for one decoded frame, then keep collecting until
+    # the batch holds BATCH_SIZE inference frames or BATCH_FILL_S has passed ──
+    batch = [ready_slots.get()]
+    fill_deadline = time.monotonic() + BATCH_FILL_S
+    while len(batch) < BATCH_FRAMES and batch[-1] is not None:
+        try:
+            batch.append(ready_slots.get(timeout=max(0.0, fill_deadline - time.monotonic())))
+        except queue.Empty:
+            break
+    if batch[-1] is None:                # capture thread hit an unreadable video
+        running = False
+        batch.pop()
+
+    # ── YOLO DETECT: every VID_STRIDE-th frame of the batch, in a single call ──
+    infer_slots = [s for k, s in enumerate(batch) if (frame_id + k) % VID_STRIDE == 0]
+    batch_results = iter(model([canvases[s, HUD_H:] for s in infer_slots], **infer_kwargs)
+                         if infer_slots else ())
+
+    for slot in batch:
+        canvas  = canvases[slot]
+        hud_bar = canvas[:HUD_H]
+        frame   = canvas[HUD_H:]
+        frame_id += 1
+
+        # Frame time: capture timestamps keep per-frame timing even within a batch
+        now = float(capture_ts[slot])
+
+        # ── FPS: frames processed per wall-clock second, so a backlog behind
+        # capture shows up (capture timestamps would only give the capture rate) ──
+        fps_frames += 1
+        fps_elapsed = time.monotonic() - fps_timer
+        if fps_elapsed >= 0.5:
+            fps = fps_frames / fps_elapsed
+            fps_timer += fps_elapsed
+            fps_frames = 0
+        frame_dt = datetime.now()                            # wall-clock stamp shared by this frame's
+        frame_ts = frame_dt.isoformat(timespec="seconds")    # log rows, peak time and history point
+
+        # ── per-frame tracking (stride-skipped frames advance the last tracks by optical flow) ──
+        infer_frame = (frame_id - 1) % VID_STRIDE == 0
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY) if VID_STRIDE > 1 else None
+        if infer_frame:
+            results = next(batch_results)
+
+            # Filter the [x1, y1, x2, y2, conf, cls] rows to vehicle classes with a
+            # LUT gather on the inference device, then copy only the survivors
+            boxes = results.boxes.data
+            boxes = boxes[TRACK_MASK_DEV[boxes[:, -1].long()]].cpu().numpy()
+
+            if len(boxes):
+                sv_dets = sv.Detections(
+                    xyxy=np.ascontiguousarray(boxes[:, :4]),
+                    confidence=boxes[:, -2],
+                    class_id=boxes[:, -1].astype(int),
+                )
+            else:
+                sv_dets = sv.Detections.empty()
+
+            # ── BYTETRACK ──
+            tracked = tracker.update_with_detections(sv_dets)
+        elif len(tracked):
+            # No YOLO this frame: move the last boxes with the scene and let
+            # ByteTrack consume them, so tracks and the Kalman state keep pace
+            tracked = tracker.update_with_detections(flow_detections(tracked, prev_gray, gray))
+        prev_gray = gray
+
+        # ── PER-FRAME ACCUMULATORS ──
+        lane_counts.fill(0)
+        active_ids  = set()
+        active_incidents      = []
+        frame_speeders        = []
+        frame_wrong_way: set  = set()
+        frame_tailgating: list = []
+        queue_counts: dict    = {}     # lane_id → stopped-vehicle count
+        emergency_lane_this_frame = None
+
+        # Box corners, centroids and lane membership for every track in one pass
+        boxes_i   = tracked.xyxy.astype(np.int32)
+        cxs       = (boxes_i[:, 0] + boxes_i[:, 2]) // 2
+        cys       = (boxes_i[:, 1] + boxes_i[:, 3]) // 2
+        box_list  = boxes_i.tolist()
+        cx_list, cy_list = cxs.tolist(), cys.tolist()
+        lane_hits = assign_lanes(cxs, cys).tolist()
+        id_list   = [] if tracked.tracker_id is None else tracked.tracker_id.tolist()
+
+        # ── SPEEDS (pixels/sec → km/h via PIXEL_TO_METER) for every track at once ──
+        # Cached positions on skipped frames would fake a standstill, so only
+        # fresh detections enter the history.
+        track_slots, fresh_slots = track_history.slots(id_list)
+        incident_detector.forget(fresh_slots)   # rows that just changed owner
+        if infer_frame:
+            track_history.push(track_slots, cxs[:len(track_slots)], cys[:len(track_slots)], now)
+        ends = track_history.ends(track_slots)
+        speed_valid = (ends[:, 5] > ends[:, 2]).tolist()    # history spans real time
+        speed_list  = track_speeds(ends, PIXEL_TO_METER).tolist()
+
+        # Resolve each track's lane: this frame's hit, else the last confirmed one
+        for i, track_id in enumerate(id_list):
+            if lane_hits[i]:
+                vehicle_last_lane[track_id] = lane_hits[i]
+            else:
+                lane_hits[i] = vehicle_last_lane.get(track_id, 0)
+        lane_arr = np.array(lane_hits[:len(id_list)], dtype=np.intp)
+        in_lane  = lane_arr > 0
+
+        # ── LANE COUNTS: (lane, class) histogram of every laned vehicle at once ──
+        cls_list   = tracked.class_id.tolist()
+        class_cols = CLASS_COL[tracked.class_id[:len(id_list)].astype(np.intp)]
+        counted    = in_lane & (class_cols >= 0)
+        np.add.at(lane_counts, (lane_arr[counted] - 1, class_cols[counted]), 1)
+
+        # ── INCIDENTS + FLOW RATE for every laned track at once ──
+        incident_arr = np.zeros(len(id_list), dtype=bool)
+        incident_arr[in_lane] = incident_detector.update_batch(
+            track_slots[in_lane], cxs[:len(id_list)][in_lane], cys[:len(id_list)][in_lane], now)
+        incident_list = incident_arr.tolist()
+        if infer_frame:   # fresh detections only
+            flow_tracker.record_batch(lane_arr[in_lane], np.asarray(id_list)[in_lane], now)
+
+        # Draw commands collected by the vehicle loop and issued together after it
+        rect_cmds: list  = []   # (pt1, pt2, color, thickness)
+        txt_speeding     = []   # (text, org) per label style
+        txt_incident     = []
+        txt_normal       = []
+        txt_lane         = []
+
         for i in range(len(tracked)):
-            track_id = int(tracked.tracker_id[i])
-            x1,y1,x2,y2 = map(int, tracked.xyxy[i])
-            history = speed_history[track_id]
-            if len(history) >= 2:
-                p1, p2 = history[0], history[-1]
-                dt = p2[2] - p1[2]
-                if dt > 0:
-                    speed = (hypot(p2[0]-p1[0], p2[1]-p1[1]) * PIXEL_TO_METER / dt) * 3.6
-                    color = (0,255,0) if speed < 40 else (0,165,255) if speed < 80 else (0,0,255)
+            x1, y1, x2, y2 = box_list[i]
+            track_id = id_list[i]
+            cls_id   = cls_list[i]
+            label    = model.names[cls_id]
+            cx, cy   = cx_list[i], cy_list[i]
+            active_ids.add(track_id)
+            lane_id  = lane_hits[i] or None   # None: never seen in a lane
+
+            speed_kmh = speed_list[i]
+
+            # ── SPEED CAMERA ──
+            if speed_kmh > SPEED_LIMIT_KMPH:
+                event = speeder_logger.log(frame_id, track_id, lane_id, speed_kmh, label, ts=frame_ts)
+                if event:
+                    frame_speeders.append(event)
+                # Police-style red alert box
+                rect_cmds.append(((x1,y1), (x2,y2), (0,0,220), 3))
+                rect_cmds.append(((x1, y1-28), (x1+220, y1), (0,0,220), -1))
+                txt_speeding.append((f"SPEEDING  {int(speed_kmh)} km/h", (x1+4, y1-8)))
+
+            # ── EMERGENCY VEHICLE DETECTION ──
+            if EMERGENCY_MASK[cls_id] and speed_kmh > EMERGENCY_SPEED_KMH and lane_id:
+                emergency_lane_this_frame = lane_id
+
+            # Incident detection
+            if incident_list[i]:
+                still_since = incident_detector.still_since[track_slots[i]]
+                duration = round(float(now - still_since), 1)
+                active_incidents.append({
+                    "track_id": track_id, "lane": lane_id,
+                    "cx": cx, "cy": cy, "duration": duration
+                })
+                # Red highlight
+                rect_cmds.append(((x1,y1), (x2,y2), (0,0,255), 3))
+                txt_incident.append((f"INCIDENT! {duration}s", (x1, y1-10)))
+            elif speed_kmh <= SPEED_LIMIT_KMPH:  # don't overwrite speeding box
+                # Normal annotation with speed
+                rect_cmds.append(((x1,y1), (x2,y2), (0,255,0), 2))
+                speed_txt = f"{int(speed_kmh)}km/h" if speed_kmh > 2 else label
+                txt_normal.append((f"ID{track_id} {speed_txt}", (x1, y1-8)))
+
+            # Lane label on vehicle
+            if lane_id:
+                txt_lane.append((f"L{lane_id}", (cx, cy)))
+
+        # ── DRAW: every box, then the labels one font style at a time ──
+        for pt1, pt2, color, thickness in rect_cmds:
+            cv2.rectangle(frame, pt1, pt2, color, thickness)
+        for cmds, scale, color, thickness in ((txt_speeding, 0.58, (255,255,255), 2),
+                                              (txt_incident, 0.6,  (0,0,255),     2),
+                                              (txt_normal,   0.52, (0,255,0),     2),
+                                              (txt_lane,     0.5,  (255,255,255), 1)):
+            for text, org in cmds:
+                cv2.putText(frame, text, org, cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness)
+
+        # ── HEATMAP (fresh detections only) ──
+        if infer_frame:
+            splat_heatmap(cxs, cys)
+
+        incident_detector.cleanup(track_slots)
+        lane_counts.sum(axis=1, out=lane_totals)
+        total_vehicles = int(lane_totals.sum())
+
+        # ── SESSION STATS + LOS + FLOW (computed once per frame, after vehicle loop) ──
+        session_stats.all_ids.update(active_ids)
+        if total_vehicles > session_stats.peak_count:
+            session_stats.peak_count = total_vehicles
+            session_stats.peak_time  = frame_dt.strftime("%H:%M:%S")
+        if frame_id % 90 == 0:   # history snapshot every ~3 s
+            history_seq += 1
+            history_buf.append({
+                "seq": history_seq,
+                "t": frame_dt.strftime("%H:%M:%S"),
+                "lanes": {str(k): t for k, t in enumerate(lane_totals.tolist(), 1)}
+            })
+
+        # ── TREND TRACKER: feed this frame's counts (one sample per inference) ──
+        if infer_frame:
+            for lane_id, total in enumerate(lane_totals.tolist(), 1):
+                trend_tracker.update(lane_id, total)
+            trends_dirty = True
+
+        # ── MODES ──
+        if mode == "lanes":
+            density = bands(DENSITY_BOUNDS, lane_totals)
+            for i, (lx1,ly1,lx2,ly2) in enumerate(lanes, 1):
+                total = lane_totals[i - 1]
+                color = DENSITY_COLORS[density[i - 1]]
+                cv2.rectangle(frame, (lx1,ly1), (lx2,ly2), color, 2)
+                cv2.putText(frame, f"Lane {i} ({total})", (lx1+5, ly1+22),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.65, color, 2)
+            y = 60
+            for i, ((car, bus, truck, bike), band) in enumerate(zip(lane_counts.tolist(), density), 1):
+                status = DENSITY_STATUS[band]
+                cv2.putText(frame, f"Lane {i}: {car}C {bus}B {truck}T {bike}M | {status}",
+                            (20, y), cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255,255,255), 1)
+                y += 22
+
+        elif mode == "heatmap":
+            # The full-frame blur dominates this mode; density changes slowly, so
+            # re-render every HEATMAP_REFRESH frames and blend the cached overlay
+            if heat_overlay is None or frame_id - heat_overlay_frame >= HEATMAP_REFRESH:
+                blur = cv2.GaussianBlur(heatmap, (0,0), 25 * HEATMAP_SCALE)
+                norm = cv2.normalize(blur, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+                norm = cv2.resize(norm, (frame.shape[1], frame.shape[0]), interpolation=cv2.INTER_LINEAR)
+                heat_overlay = cv2.applyColorMap(norm, cv2.COLORMAP_JET)
+                heat_overlay_frame = frame_id
+            cv2.addWeighted(frame, 0.55, heat_overlay, 0.45, 0, dst=frame)
+
+        elif mode == "speed":
+            # Reuses this frame's speed pass instead of recomputing from history
+            for (x1, y1, x2, y2), speed, band, valid in zip(box_list, speed_list,
+                                                            bands(SPEED_BOUNDS, speed_list), speed_valid):
+                if valid:
+                    color = SPEED_COLORS[band]
                     cv2.putText(frame, f"{int(speed)} km/h", (x1, y1-10),
                                 cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
 
-    elif mode == "timer":
-        # ── Helper: anti-starvation priority score ──
-        # Score = vehicle_count + wait_bonus so lanes that haven't had green
-        # in a long time naturally rise to the top even with few vehicles.
-        # MAX_WAIT guarantees every lane is served at least once per 120s.
-        MAX_WAIT       = 120   # seconds — forced green after this wait
-        WAIT_SCALE     = 5.0   # 1 extra priority point per WAIT_SCALE seconds waited
-        _now = time.time()
-        def priority_score(lane_idx):
-            vehicles  = sum(lane_counts[lane_idx + 1].values())
-            trend_val = trend_tracker.trend(lane_idx + 1)   # +ve = rising demand
-            waited    = _now - lane_last_green.get(lane_idx, _now - MAX_WAIT)
-            if waited >= MAX_WAIT:          # starvation guard — force to front
-                return float("inf")
-            # Rising lanes jump the queue sooner; falling lanes wait a little longer
-            return vehicles + (trend_val * 2) + (waited / WAIT_SCALE)
-
-        def next_priority_lane():
-            waiting = [i for i in range(len(lanes)) if i != signal_index]
-            if not waiting:
-                return (signal_index + 1) % len(lanes)
-            return max(waiting, key=priority_score)
-
-        # ── Initialise timer on first entry into timer mode ──
-        if signal_timer < 0:
-            lane_last_green[signal_index] = time.time()   # mark lane 0 as starting now
-            total      = sum(lane_counts[signal_index + 1].values())
-            trend_val  = trend_tracker.trend(signal_index + 1)
-            trend_adj  = int(trend_val * 4)              # ~4s per slope unit
-            signal_timer = min(90, max(15, total * 3 + trend_adj))
-            signal_start = time.time()
-
-        elapsed   = time.time() - signal_start
-        remaining = max(0, int(signal_timer - elapsed))
-        current_lane_vehicles = sum(lane_counts[signal_index + 1].values())
-        now = time.time()
-        ADJUST_COOLDOWN = 25   # seconds between adjustments (prevents per-frame trimming)
-        MIN_EMERGENCY   = 10   # minimum seconds to leave on green during emergency trim
-        MIN_CONGESTION  = 15   # minimum seconds to leave on green during congestion trim
-        TRIM_EMERGENCY  = 20   # how many seconds to cut on emergency
-        TRIM_CONGESTION = 10   # how many seconds to cut on congestion
-
-        adjust_label = None
-
-        # ── EMERGENCY PRIORITY: trim current green — don't hard-switch ──
-        # Gives the current lane time to stop safely, then the priority lane
-        # gets its turn sooner because the queue ahead of it is shorter.
-        if (emergency_lane_this_frame is not None
-                and (emergency_lane_this_frame - 1) != signal_index
-                and now - last_priority_adjust_time >= ADJUST_COOLDOWN):
-            new_remaining = max(MIN_EMERGENCY, remaining - TRIM_EMERGENCY)
-            if new_remaining < remaining:           # only act if it actually shortens
-                signal_timer = elapsed + new_remaining
-                remaining    = new_remaining
-                last_priority_adjust_time = now
-                adjust_label = f"EMERGENCY DETECTED  |  Green shortened by {TRIM_EMERGENCY}s"
-
-        # ── CONGESTION ADJUSTMENT: trim green when current lane has cleared ──
-        # but a waiting lane is overflowing AND minimum hold-time has passed
-        elif (now - last_priority_adjust_time >= ADJUST_COOLDOWN
-              and elapsed >= 10          # held green for at least 10s first
-              and remaining > MIN_CONGESTION):
-            max_waiting = max(
-                (sum(lane_counts[i + 1].values()) for i in range(len(lanes)) if i != signal_index),
-                default=0
-            )
-            if current_lane_vehicles <= 2 and max_waiting >= 10:
-                new_remaining = max(MIN_CONGESTION, remaining - TRIM_CONGESTION)
-                if new_remaining < remaining:
+        elif mode == "timer":
+            # ── Anti-starvation priority score ──
+            # Score = vehicle_count + 2·trend + wait_bonus so lanes that haven't had green
+            # in a long time naturally rise to the top even with few vehicles.
+            # MAX_WAIT guarantees every lane is served at least once per 120s.
+            MAX_WAIT       = 120   # seconds — forced green after this wait
+            WAIT_SCALE     = 5.0   # 1 extra priority point per WAIT_SCALE seconds waited
+            lane_slopes    = trend_tracker.trends()   # +ve = rising demand, [lane_index]
+            density        = bands(DENSITY_BOUNDS, lane_totals)
+
+            # ── Initialise timer on first entry into timer mode ──
+            if signal_timer < 0:
+                lane_last_green[signal_index] = now   # mark lane 0 as starting now
+                total      = int(lane_totals[signal_index])
+                trend_val  = lane_slopes[signal_index]
+                trend_adj  = int(trend_val * 4)              # ~4s per slope unit
+                signal_timer = min(90, max(15, total * 3 + trend_adj))
+                signal_start = now
+
+            # All phase timing runs on the frame's capture time
+            elapsed   = now - signal_start
+            remaining = max(0, int(signal_timer - elapsed))
+            current_lane_vehicles = lane_totals[signal_index]
+            ADJUST_COOLDOWN = 25   # seconds between adjustments (prevents per-frame trimming)
+            MIN_EMERGENCY   = 10   # minimum seconds to leave on green during emergency trim
+            MIN_CONGESTION  = 15   # minimum seconds to leave on green during congestion trim
+            TRIM_EMERGENCY  = 20   # how many seconds to cut on emergency
+            TRIM_CONGESTION = 10   # how many seconds to cut on congestion
+
+            adjust_label = None
+
+            # ── EMERGENCY PRIORITY: trim current green — don't hard-switch ──
+            # Gives the current lane time to stop safely, then the priority lane
+            # gets its turn sooner because the queue ahead of it is shorter.
+            if (emergency_lane_this_frame is not None
+                    and (emergency_lane_this_frame - 1) != signal_index
+                    and now - last_priority_adjust_time >= ADJUST_COOLDOWN):
+                new_remaining = max(MIN_EMERGENCY, remaining - TRIM_EMERGENCY)
+                if new_remaining < remaining:           # only act if it actually shortens
                     signal_timer = elapsed + new_remaining
                     remaining    = new_remaining
                     last_priority_adjust_time = now
-                    adjust_label = f"CONGESTION  |  Green shortened by {TRIM_CONGESTION}s"
-
-        # Show adjustment banner if triggered
-        if adjust_label:
-            cv2.putText(frame, adjust_label, (20, frame.shape[0] - 90),
-                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 200, 255), 2)
-
-        for i, (lx1, ly1, lx2, ly2) in enumerate(lanes):
-            lane_total  = sum(lane_counts[i + 1].values())
-            trend_arrow = trend_tracker.label_ascii(i + 1)
-            if i == signal_index:
-                cv2.rectangle(frame, (lx1, ly1), (lx2, ly2), (0, 255, 0), 4)
-                cv2.putText(frame, f"GO ({remaining}s) [{lane_total}v] {trend_arrow}",
-                            (lx1 + 10, ly1 + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+                    adjust_label = f"EMERGENCY DETECTED  |  Green shortened by {TRIM_EMERGENCY}s"
+
+            # ── CONGESTION ADJUSTMENT: trim green when current lane has cleared ──
+            # but a waiting lane is overflowing AND minimum hold-time has passed
+            elif (now - last_priority_adjust_time >= ADJUST_COOLDOWN
+                  and elapsed >= 10          # held green for at least 10s first
+                  and remaining > MIN_CONGESTION):
+                max_waiting = max(
+                    (lane_totals[i] for i in range(len(lanes)) if i != signal_index),
+                    default=0
+                )
+                if current_lane_vehicles <= 2 and max_waiting >= 10:
+                    new_remaining = max(MIN_CONGESTION, remaining - TRIM_CONGESTION)
+                    if new_remaining < remaining:
+                        signal_timer = elapsed + new_remaining
+                        remaining    = new_remaining
+                        last_priority_adjust_time = now
+                        adjust_label = f"CONGESTION  |  Green shortened by {TRIM_CONGESTION}s"
+
+            # Show adjustment banner if triggered
+            if adjust_label:
+                cv2.putText(frame, adjust_label, (20, frame.shape[0] - 90),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 200, 255), 2)
+
+            for i, (lx1, ly1, lx2, ly2) in enumerate(lanes):
+                lane_total  = lane_totals[i]
+                trend_arrow = trend_tracker.label_ascii(i + 1)
+                if i == signal_index:
+                    cv2.rectangle(frame, (lx1, ly1), (lx2, ly2), (0, 255, 0), 4)
+                    cv2.putText(frame, f"GO ({remaining}s) [{lane_total}v] {trend_arrow}",
+                                (lx1 + 10, ly1 + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+                else:
+                    # Estimate wait time for this lane
+                    red_time = remaining
+                    check = signal_index
+                    while check != i:
+                        check = (check + 1) % len(lanes)
+                        _t     = int(lane_totals[check])
+                        _tadj  = int(lane_slopes[check] * 4)
+                        red_time += min(90, max(15, _t * 3 + _tadj))
+                    box_color = DENSITY_RED_COLORS[density[i]]
+                    cv2.rectangle(frame, (lx1, ly1), (lx2, ly2), box_color, 2)
+                    cv2.putText(frame, f"RED (~{red_time}s) [{lane_total}v] {trend_arrow}",
+                                (lx1 + 10, ly1 + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.75, box_color, 2)
+
+            # ── Advance to highest-priority waiting lane when timer expires ──
+            if elapsed >= signal_timer:
+                # Score every lane at once; rising lanes jump the queue sooner,
+                # falling lanes wait a little longer, starved lanes go first
+                waited = now - lane_last_green
+                scores = lane_totals + 2 * lane_slopes + waited / WAIT_SCALE
+                scores[waited >= MAX_WAIT] = np.inf
+                if len(lanes) > 1:
+                    scores[signal_index] = -np.inf   # pick among the waiting lanes
+                signal_index = int(scores.argmax())
+                lane_last_green[signal_index] = now   # mark green start
+                total      = int(lane_totals[signal_index])
+                trend_val  = lane_slopes[signal_index]
+                trend_adj  = int(trend_val * 4)              # pre-adjust for rising/falling demand
+                signal_timer = min(90, max(15, total * 3 + trend_adj))
+                signal_start = now
+                last_priority_adjust_time = 0.0   # reset cooldown for new phase
+
+        # ── INCIDENT OVERLAYS ──
+        for inc in active_incidents:
+            cv2.putText(frame, f"[!] INCIDENT L{inc['lane']}", (20, frame.shape[0]-60),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,0,255), 2)
+
+        # ── HUD BAR ──
+        dash_url = f"http://localhost:{FLASK_PORT}"
+        hud_text = f"MODE: {mode.upper()}  |  Vehicles: {total_vehicles}  |  FPS: {fps:.1f}  |  Incidents: {len(active_incidents)}  |  Dashboard: {dash_url}"
+        hud_bar[:] = 0
+        cv2.putText(hud_bar, hud_text, (14, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255,255,255), 1)
+        frame = canvas   # HUD bar + frame, already laid out in one buffer
+
+        # ── PUBLISH SHARED STATE (build new snapshot, then swap the reference) ──
+        # The dashboard can't follow every frame, so snapshots go out at most every
+        # PUBLISH_INTERVAL_S; speeding events, emergencies and incident changes
+        # publish straight away (speeders are per-frame and would be lost).
+        # Incidents compare by identity: their durations grow every frame, so
+        # they ride along with each throttled publish and the dashboard updates
+        # them in place; incidents_seq only marks the card list for a rebuild.
+        incident_keys     = {(inc["track_id"], inc["lane"]) for inc in active_incidents}
+        incidents_changed = incident_keys != published_incidents
+        if (now - last_publish >= PUBLISH_INTERVAL_S or frame_speeders
+                or emergency_lane_this_frame is not None or incidents_changed):
+            last_publish = now
+            published_incidents = incident_keys
+            # Nested objects whose inputs did not change are carried over from the
+            # previous snapshot: nothing is rebuilt, and SSE diffs skip them by identity
+            prev = shared_state
+            if not np.array_equal(lane_counts, last_lane_counts):
+                last_lane_counts[:] = lane_counts
+                lane_counts_out = {str(k): dict(zip(VEHICLE_CLASSES, c))
+                                   for k, c in enumerate(lane_counts.tolist(), 1)}
+                lane_los_out    = {str(k): g[0] for k, g in enumerate(los_grades(lane_totals), 1)}
             else:
-                # Estimate wait time for this lane
-                red_time = remaining
-                check = signal_index
-                while check != i:
-                    check = (check + 1) % len(lanes)
-                    _t     = sum(lane_counts[check + 1].values())
-                    _tadj  = int(trend_tracker.trend(check + 1) * 4)
-                    red_time += min(90, max(15, _t * 3 + _tadj))
-                box_color = (0, 160, 255) if lane_total < 5 else (0, 0, 220) if lane_total < 15 else (0, 0, 180)
-                cv2.rectangle(frame, (lx1, ly1), (lx2, ly2), box_color, 2)
-                cv2.putText(frame, f"RED (~{red_time}s) [{lane_total}v] {trend_arrow}",
-                            (lx1 + 10, ly1 + 30), cv2.FONT_HERSHEY_SIMPLEX, 0.75, box_color, 2)
-
-        # ── Advance to highest-priority waiting lane when timer expires ──
-        if elapsed >= signal_timer:
-            signal_index = next_priority_lane()
-            lane_last_green[signal_index] = time.time()   # mark green start
-            total      = sum(lane_counts[signal_index + 1].values())
-            trend_val  = trend_tracker.trend(signal_index + 1)
-            trend_adj  = int(trend_val * 4)              # pre-adjust for rising/falling demand
-            signal_timer = min(90, max(15, total * 3 + trend_adj))
-            signal_start = time.time()
-            last_priority_adjust_time = 0.0   # reset cooldown for new phase
-
-    # ── INCIDENT OVERLAYS ──
-    for inc in active_incidents:
-        cv2.putText(frame, f"[!] INCIDENT L{inc['lane']}", (20, frame.shape[0]-60),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0,0,255), 2)
-
-    # ── HUD BAR ──
-    dash_url = f"http://localhost:{FLASK_PORT}"
-    hud_text = f"MODE: {mode.upper()}  |  Vehicles: {total_vehicles}  |  FPS: {fps:.1f}  |  Incidents: {len(active_incidents)}  |  Dashboard: {dash_url}"
-    hud_bar = np.zeros((46, frame.shape[1], 3), dtype=np.uint8)
-    cv2.putText(hud_bar, hud_text, (14, 30),
-                cv2.FONT_HERSHEY_SIMPLEX, 0.55, (255,255,255), 1)
-    frame = np.vstack((hud_bar, frame))
-
-    # ── UPDATE SHARED STATE ──
-    with state_lock:
-        shared_state["lane_counts"]       = {str(k): dict(v) for k, v in lane_counts.items()}
-        shared_state["vehicle_count"]     = total_vehicles
-        shared_state["incidents"]         = active_incidents
-        shared_state["mode"]              = mode
-        shared_state["fps"]               = round(fps, 1)
-        shared_state["frame_id"]          = frame_id
-        shared_state["emergency_active"]  = emergency_lane_this_frame is not None
-        shared_state["emergency_lane"]    = emergency_lane_this_frame
-        shared_state["lane_trends"]       = {str(k): trend_tracker.label(k) for k in lane_counts}
-        shared_state["lane_los"]          = lane_los_out
-        shared_state["lane_flow"]         = lane_flow_out
-        shared_state["lane_queue"]        = {str(k): queue_counts.get(k, 0) for k in lane_counts}
-        shared_state["wrong_way"]         = list(frame_wrong_way)
-        shared_state["tailgating"]        = frame_tailgating[:5]   # cap at 5
-        # Keep last 10 speeding events
-        if frame_speeders:
-            shared_state["speeders"] = (shared_state["speeders"] + frame_speeders)[-10:]
-
-    # ── LOG EVERY 30 FRAMES ──
-    if frame_id % 30 == 0:
-        logger.log(frame_id, lane_counts, active_incidents)
-
-    # ── DISPLAY ──
-    cv2.imshow("Traffic Analysis  [L/H/S/T]  Q=quit", frame)
-    key = cv2.waitKey(30) & 0xFF   # 30ms gives reliable key capture
-    if key == ord("l"):
-        mode = "lanes"
-    elif key == ord("h"):
-        mode = "heatmap"
-    elif key == ord("s"):
-        mode = "speed"
-    elif key == ord("t"):
-        mode = "timer"
-    elif key == ord("q") or key == 27:   # Q or Esc
-        break
-    # Check if window was closed (WND_PROP_AUTOSIZE is reliable cross-platform)
-    try:
-        if cv2.getWindowProperty("Traffic Analysis  [L/H/S/T]  Q=quit",
-                                  cv2.WND_PROP_AUTOSIZE) < 0:
-            break
-    except cv2.error:
-        break
-
+                lane_counts_out, lane_los_out = prev["lane_counts"], prev["lane_los"]
+            if trends_dirty:   # trends only move on inference frames
+                lane_trends_out = {str(k): trend_tracker.label(k) for k in all_lane_ids}
+                trends_dirty    = False
+            else:
+                lane_trends_out = prev["lane_trends"]
+            lane_flow_out   = carry(prev["lane_flow"],
+                                    {str(k): flow_tracker.rate(k, now) for k in all_lane_ids})
+            lane_queue_out  = carry(prev["lane_queue"],
+                                    {str(k): queue_counts.get(k, 0) for k in all_lane_ids})
+            shared_state = {
+                **shared_state,
+                "lane_counts":      lane_counts_out,
+                "vehicle_count":    total_vehicles,
+                "incidents":        active_incidents,
+                "incidents_seq":    shared_state["incidents_seq"] + incidents_changed,
+                "mode":             mode,
+                "fps":              round(fps, 1),
+                "frame_id":         frame_id,
+                "emergency_active": emergency_lane_this_frame is not None,
+                "emergency_lane":   emergency_lane_this_frame,
+                "lane_trends":      lane_trends_out,
+                "lane_los":         lane_los_out,
+                "lane_flow":        lane_flow_out,
+                "lane_queue":       lane_queue_out,
+                "wrong_way":        list(frame_wrong_way),
+                "tailgating":       frame_tailgating[:5],   # cap at 5
+                # Keep last 10 speeding events
+                "speeders":         (shared_state["speeders"] + frame_speeders)[-10:]
+                                    if frame_speeders else shared_state["speeders"],
+                "speeders_seq":     shared_state["speeders_seq"] + len(frame_speeders),
+            }
+            with state_cond:
+                state_cond.notify_all()
+
+        # ── LOG EVERY 30 FRAMES ──
+        if frame_id % 30 == 0:
+            logger.log(frame_id, lane_counts, active_incidents, ts=frame_ts)
+
+        # ── DISPLAY (every DISPLAY_EVERY-th frame; never sleeps the loop) ──
+        if frame_id % DISPLAY_EVERY == 0:
+            cv2.imshow("Traffic Analysis  [L/H/S/T]  Q=quit", frame)
+            key = cv2.waitKey(1) & 0xFF    # only pumps GUI events; keys queue between calls
+            if key == ord("l"):
+                mode = "lanes"
+            elif key == ord("h"):
+                mode = "heatmap"
+            elif key == ord("s"):
+                mode = "speed"
+            elif key == ord("t"):
+                mode = "timer"
+            elif key == ord("q") or key == 27:   # Q or Esc
+                running = False
+                break
+            # Check if window was closed (WND_PROP_AUTOSIZE is reliable cross-platform)
+            try:
+                if cv2.getWindowProperty("Traffic Analysis  [L/H/S/T]  Q=quit",
+                                          cv2.WND_PROP_AUTOSIZE) < 0:
+                    running = False
+                    break
+            except cv2.error:
+                running = False
+                break
+        free_slots.put(slot)   # canvas done — hand it back to the capture thread
+
+free_slots.put(None)              # stop the capture thread before releasing the device
+capture_thread.join(timeout=2.0)
 cap.release()
 cv2.destroyAllWindows()
 
 # Save heatmap on exit
 heatmap_norm = cv2.normalize(heatmap, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+heatmap_norm = cv2.resize(heatmap_norm, (canvases.shape[2], canvases.shape[1] - HUD_H),
+                          interpolation=cv2.INTER_LINEAR)   # back to video resolution
 cv2.imwrite("heatmap_export.png", cv2.applyColorMap(heatmap_norm, cv2.COLORMAP_JET))
 
 # ──────────────────────────────────────────────
 # SESSION SUMMARY
 # ──────────────────────────────────────────────
-duration_s = (datetime.now() - datetime.fromisoformat(session_stats["session_start"])).seconds
+duration_s = (datetime.now() - datetime.fromisoformat(session_stats.session_start)).seconds
 print()
 print("═" * 56)
 print("  🚦  TRAFFIC SESSION SUMMARY")
 print("═" * 56)
-print(f"  Started         : {session_stats['session_start']}")
+print(f"  Started         : {session_stats.session_start}")
 print(f"  Duration        : {duration_s // 60}m {duration_s % 60}s")
-print(f"  Total vehicles  : {len(session_stats['all_ids'])} unique IDs")
-print(f"  Peak traffic    : {session_stats['peak_count']} vehicles at {session_stats['peak_time']}")
-print(f"  Incidents       : {session_stats['total_incidents']}")
-print(f"  Wrong-way IDs   : {len(session_stats['wrong_way_ids'])} ({list(session_stats['wrong_way_ids'])[:8]})")
-print(f"  Tailgate events : {session_stats['tailgate_events']}")
+print(f"  Total vehicles  : {len(session_stats.all_ids)} unique IDs")
+print(f"  Peak traffic    : {session_stats.peak_count} vehicles at {session_stats.peak_time}")
+print(f"  Incidents       : {session_stats.total_incidents}")
+print(f"  Wrong-way IDs   : {len(session_stats.wrong_way_ids)} ({list(session_stats.wrong_way_ids)[:8]})")
+print(f"  Tailgate events : {session_stats.tailgate_events}")
 print(f"  Log             : {LOG_FILE}")
 print(f"  Heatmap         : heatmap_export.png")
 print("═" * 56)